@@ -0,0 +1,257 @@
+# Asyncio entry point built on Bolt's AsyncApp. Run with `python async_main.py`.
+# Student questions are answered natively with the async Dialogflow clients so one worker can keep many in flight.
+# Everything else (App Home, uploads, removals, learning) reuses the sync listeners in main.py on worker threads.
+import os
+import re
+import asyncio
+import functools
+
+from aiohttp import web
+
+from slack_bolt import BoltResponse
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.oauth.async_oauth_settings import AsyncOAuthSettings
+from slack_bolt.oauth.async_callback_options import AsyncCallbackOptions, AsyncSuccessArgs, AsyncFailureArgs
+
+from slack_sdk import WebClient
+
+import main
+
+from slack_utils import app_constants, db_utils, message_utils
+from slack_utils.async_store_utils import AsyncInstallationStoreAdapter, AsyncOAuthStateStoreAdapter, run_in_thread
+from dialogflow_utils import async_utils, document_utils, intent_utils
+
+project_id = main.project_id
+
+# OAuth
+
+async def success(args: AsyncSuccessArgs) -> BoltResponse:
+	await run_in_thread(main.create_team_knowledge_base, args.installation.team_id)
+
+	return await args.default.success(args)
+
+async def failure(args: AsyncFailureArgs) -> BoltResponse:
+	return BoltResponse(status=args.suggested_status_code, body=args.reason)
+
+# App
+
+installation_store = AsyncInstallationStoreAdapter(main.installation_store)
+
+app = AsyncApp(
+	signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
+	installation_store=installation_store,
+	oauth_settings=AsyncOAuthSettings(
+		client_id=os.environ.get("SLACK_CLIENT_ID"),
+		client_secret=os.environ.get("SLACK_CLIENT_SECRET"),
+		scopes=main.oauth_scopes,
+		user_scopes=[],
+		redirect_uri=None,
+		install_path="/slack/install",
+		redirect_uri_path="/slack/oauth_redirect",
+		installation_store=installation_store,
+		state_store=AsyncOAuthStateStoreAdapter(main.oauth_state_store),
+		callback_options=AsyncCallbackOptions(success=success, failure=failure),
+	)
+)
+
+@app.middleware
+async def deduplicate_events(body, next):
+	event_id = body.get("event_id")
+
+	if event_id is not None and not await run_in_thread(main.event_store.add_if_absent, event_id):
+		return BoltResponse(status=429, body="", headers={"X-Slack-No-Retry": "1"})
+
+	return await next()
+
+# Utilities
+
+async def run_sync_listener(listener, context, **kwargs):
+	"""Runs one of main.py's listeners on a worker thread, swapping the async Bolt utilities for sync stand-ins."""
+	loop = asyncio.get_running_loop()
+
+	def to_sync(async_function):
+		return lambda *args, **kw: asyncio.run_coroutine_threadsafe(async_function(*args, **kw), loop).result()
+
+	for name in ("ack", "say", "respond"):
+		if name in kwargs:
+			kwargs[name] = to_sync(kwargs[name])
+
+	if "client" in kwargs:
+		kwargs["client"] = WebClient(token=context.get("bot_token"))
+
+	return await loop.run_in_executor(None, functools.partial(listener, **kwargs))
+
+async def get_dialogflow_response(text, team_id, user_id):
+	existing_knowledge_base = await async_utils.get_knowledge_base_by_name(
+		project_id=project_id,
+		knowledge_base_name=team_id
+	)
+
+	if existing_knowledge_base is None:
+		return f"Hello <@{user_id}>, unfortunately I am not set up yet."
+
+	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
+
+	# Only submits a background re-list of the entry index once it goes stale, it never blocks the loop.
+	document_utils.refresh_document_index(project_id, knowledge_base_id)
+
+	generation = document_utils.get_document_generation(knowledge_base_id)
+
+	found, response = intent_utils.get_cached_answer(knowledge_base_id, text, generation)
+
+	if not found:
+		response = main.get_local_answer(knowledge_base_id, text)
+
+	if not found and response is None:
+		detected_knowledge = (await async_utils.detect_intent_knowledge(
+			project_id=project_id,
+			session_id=team_id + "_" + user_id,
+			language_code="en",
+			knowledge_base_id=knowledge_base_id,
+			texts=[text]
+		))[0]
+
+		# Warm the metadata cache here so formatting the answer never makes a blocking RPC.
+		if detected_knowledge.answers:
+			await async_utils.get_document_metadata(
+				project_id=project_id,
+				knowledge_base_id=knowledge_base_id,
+				document_id=detected_knowledge.answers[0].source.rpartition("/")[2]
+			)
+
+		response = main.format_knowledge_answer(text, knowledge_base_id, detected_knowledge)
+		intent_utils.cache_answer(knowledge_base_id, text, generation, response)
+
+	if response is None:
+		return app_constants.get_unknown_answer_response()
+
+	return response
+
+# Commands
+
+@app.command("/add-file")
+async def add_file_command(ack, respond, body, client, context):
+	await run_sync_listener(main.add_file_command, context, ack=ack, respond=respond, body=body, client=client)
+
+@app.command("/add-entry")
+async def add_entry_command(ack, respond, body, client, context):
+	await run_sync_listener(main.add_entry_command, context, ack=ack, respond=respond, body=body, client=client)
+
+@app.command("/compact-entries")
+async def compact_entries_command(ack, respond, body, client, context):
+	await run_sync_listener(main.compact_entries_command, context, ack=ack, respond=respond, body=body, client=client, context=context)
+
+@app.command("/import-entries")
+async def import_entries_command(ack, respond, body, client, context):
+	await run_sync_listener(main.import_entries_command, context, ack=ack, respond=respond, body=body, client=client, context=context)
+
+@app.command("/export-entries")
+async def export_entries_command(ack, respond, body, client, context):
+	await run_sync_listener(main.export_entries_command, context, ack=ack, respond=respond, body=body, client=client)
+
+@app.command("/ping")
+async def test_command(ack):
+	await ack("Pong!")
+
+# Event Listeners
+
+@app.event("app_uninstalled")
+async def handle_app_uninstalled(context):
+	await run_sync_listener(main.handle_app_uninstalled, context, context=context)
+
+@app.event("user_change")
+async def handle_user_change(event, context):
+	main.handle_user_change(event, context)
+
+@app.event("team_join")
+async def handle_team_join(event, context):
+	main.handle_team_join(event, context)
+
+@app.event("app_home_opened")
+async def handle_app_home_opened(client, event, context):
+	await run_sync_listener(main.handle_app_home_opened, context, client=client, event=event, context=context)
+
+@app.event("app_mention")
+async def handle_mention(event, say):
+	text = re.sub(app_constants.mention_pattern, '', event["text"])
+	team_id = event["team"]
+	user_id = event["user"]
+
+	await say(await get_dialogflow_response(text, team_id, user_id), thread_ts=event.get("thread_ts", None))
+
+@app.event("message")
+async def handle_message(message, client, say, context, event):
+	kind = message_utils.classify_message(message)
+
+	if kind is None:
+		# Dropped messages are still remembered, they may be the question an instructor answers later.
+		return message_utils.remember_message(message)
+
+	# Direct message questions are answered here, instructor replies go through the sync learning path.
+	if kind == "question":
+		text = re.sub(app_constants.mention_pattern, '', message["text"])
+		return await say(await get_dialogflow_response(text, message.get("team", context["team_id"]), message["user"]), thread_ts=message.get("thread_ts", None))
+
+	await run_sync_listener(main.handle_message, context, message=message, client=client, say=say, context=context, event=event)
+
+# Actions
+
+@app.action("add_file")
+async def add_file(ack, body, client, context):
+	await run_sync_listener(main.add_file, context, ack=ack, body=body, client=client)
+
+@app.action("remove_file")
+async def remove_file(ack, body, context, payload, client):
+	await run_sync_listener(main.remove_file, context, ack=ack, body=body, context=context, payload=payload, client=client)
+
+@app.action("add_entry")
+async def add_entry(ack, body, client, context):
+	await run_sync_listener(main.add_entry, context, ack=ack, body=body, client=client)
+
+@app.action("remove_entry")
+async def remove_entry(ack, body, context, payload, client):
+	await run_sync_listener(main.remove_entry, context, ack=ack, body=body, context=context, payload=payload, client=client)
+
+@app.action("dismiss_failed_jobs")
+async def dismiss_failed_jobs(ack, context, client):
+	await run_sync_listener(main.dismiss_failed_jobs, context, ack=ack, context=context, client=client)
+
+@app.action(re.compile("^(next|previous)_page$"))
+async def change_page(ack, context, payload, client):
+	await run_sync_listener(main.change_page, context, ack=ack, context=context, payload=payload, client=client)
+
+@app.action("search")
+async def search(ack, context, payload, client):
+	await run_sync_listener(main.search, context, ack=ack, context=context, payload=payload, client=client)
+
+@app.action("clear_search")
+async def clear_search(ack, context, client):
+	await run_sync_listener(main.clear_search, context, ack=ack, context=context, client=client)
+
+# View submissions
+
+@app.view("add-file-submission")
+async def view_add_file_submission(ack, client, view, context):
+	await run_sync_listener(main.view_add_file_submission, context, ack=ack, client=client, view=view, context=context)
+
+@app.view("add-entry-submission")
+async def view_add_entry_submission(ack, client, body, view, context):
+	await run_sync_listener(main.view_add_entry_submission, context, ack=ack, client=client, body=body, view=view, context=context)
+
+# Server
+
+@web.middleware
+async def ensure_database(request, handler):
+	if main.database_auto_create and not db_utils.schema_ready:
+		await run_in_thread(main.ensure_database)
+
+	return await handler(request)
+
+async def close_dialogflow_clients(web_app):
+	await async_utils.close_clients()
+
+if __name__ == "__main__":
+	web_app = app.web_app()
+	web_app.middlewares.append(ensure_database)
+	web_app.on_cleanup.append(close_dialogflow_clients)
+	web.run_app(web_app, port=int(os.environ.get("PORT", 3000)))
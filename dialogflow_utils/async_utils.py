@@ -0,0 +1,206 @@
+# Asyncio counterparts of the dialogflow_utils functions used while answering questions.
+# They share the caches and indexes of the sync modules, so both paths can run side by side.
+import asyncio
+
+from google.cloud import dialogflow_v2beta1 as dialogflow
+
+from dialogflow_utils import client_utils, document_utils, intent_utils, knowledge_base_utils
+
+# Async clients are bound to the event loop they were created on.
+async_clients = {}
+
+# Created lazily so it belongs to the running event loop.
+knowledge_base_list_lock = None
+
+def get_async_client(client_class):
+	"""Gets a shared async client for the running event loop.
+	Args:
+	    client_class: The Dialogflow async client class, e.g. dialogflow.SessionsAsyncClient."""
+	loop = asyncio.get_running_loop()
+	client = async_clients.get((loop, client_class))
+
+	if client is None:
+		transport_class = client_class.get_transport_class("grpc_asyncio")
+		channel = transport_class.create_channel(host=client_utils.DIALOGFLOW_HOST, options=client_utils.channel_options)
+		client = client_class(transport=transport_class(host=client_utils.DIALOGFLOW_HOST, channel=channel))
+		async_clients[(loop, client_class)] = client
+
+	return client
+
+async def close_clients():
+	"""Closes the async clients created on the running event loop."""
+	loop = asyncio.get_running_loop()
+
+	for key in [x for x in async_clients if x[0] is loop]:
+		client = async_clients.pop(key)
+
+		try:
+			await client.transport.grpc_channel.close()
+		except Exception:
+			pass
+
+async def detect_intent_knowledge(project_id, session_id, language_code, knowledge_base_id, texts):
+	"""Returns the result of detect intent with querying Knowledge Connector.
+	Args:
+	project_id: The GCP project linked with the agent you are going to query.
+	session_id: Id of the session, using the same `session_id` between requests
+	          allows continuation of the conversation.
+	language_code: Language of the queries.
+	knowledge_base_id: The Knowledge base's id to query against.
+	texts: A list of text queries to send, sent concurrently on their own sessions if there are several.
+	Returns a list with the Knowledge answers of each text, in the same order.
+	"""
+	session_client = get_async_client(dialogflow.SessionsAsyncClient)
+
+	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(
+		project_id,
+		knowledge_base_id
+	)
+
+	if len(texts) == 1:
+		session_paths = [dialogflow.SessionsClient.session_path(project_id, session_id)]
+	else:
+		session_paths = intent_utils.get_batch_session_paths(project_id, session_id, len(texts))
+
+	# At most DETECT_INTENT_WORKERS requests of a batch are in flight at once, like the sync pool.
+	semaphore = asyncio.Semaphore(intent_utils.detect_intent_workers)
+
+	async def detect_intent_text(session_path, text):
+		async with semaphore:
+			response = await session_client.detect_intent(request=intent_utils.build_detect_intent_request(session_path, language_code, knowledge_base_path, text))
+
+		return response.query_result.knowledge_answers
+
+	return list(await asyncio.gather(*[detect_intent_text(session_path, text) for session_path, text in zip(session_paths, texts)]))
+
+async def list_knowledge_bases(project_id):
+	"""Gets a list of all Knowledge base.
+	Args:
+	    project_id: The GCP project linked with the agent."""
+	client = get_async_client(dialogflow.KnowledgeBasesAsyncClient)
+	project_path = dialogflow.KnowledgeBasesClient.common_project_path(project_id)
+
+	try:
+		response = [x async for x in await client.list_knowledge_bases(parent=project_path)]
+
+		for knowledge_base in response:
+			knowledge_base_utils.cache_knowledge_base(knowledge_base)
+	except Exception:
+		response = None
+
+	return response
+
+async def get_knowledge_base_by_name(project_id, knowledge_base_name):
+	"""Gets a specific Knowledge base.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_name: Display name of the Knowledge base."""
+	global knowledge_base_list_lock
+
+	found, knowledge_base = knowledge_base_utils.get_cached_knowledge_base(knowledge_base_name)
+
+	if found:
+		return knowledge_base
+
+	if knowledge_base_list_lock is None:
+		knowledge_base_list_lock = asyncio.Lock()
+
+	async with knowledge_base_list_lock:
+		found, knowledge_base = knowledge_base_utils.get_cached_knowledge_base(knowledge_base_name)
+
+		if found:
+			return knowledge_base
+
+		if await list_knowledge_bases(project_id) is None:
+			return None
+
+		found, knowledge_base = knowledge_base_utils.get_cached_knowledge_base(knowledge_base_name)
+
+		if knowledge_base is None:
+			with knowledge_base_utils.knowledge_base_cache_lock:
+				knowledge_base_utils.knowledge_base_miss_cache[knowledge_base_name] = True
+
+	return knowledge_base
+
+async def get_document_metadata(project_id, knowledge_base_id, document_id):
+	"""Gets the display name and type of a Document without downloading its content.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_id: Id of the Document."""
+	with document_utils.document_index_lock:
+		metadata = document_utils.document_metadata_cache.get((knowledge_base_id, document_id))
+
+	if metadata is not None:
+		return metadata
+
+	client = get_async_client(dialogflow.DocumentsAsyncClient)
+	document_path = dialogflow.DocumentsClient.document_path(project_id, knowledge_base_id, document_id)
+
+	document = await client.get_document(name=document_path, metadata=[("x-goog-fieldmask", document_utils.DOCUMENT_METADATA_FIELDS)])
+	metadata = document_utils.get_document_metadata_from(document)
+
+	with document_utils.document_index_lock:
+		document_utils.document_metadata_cache[(knowledge_base_id, document_id)] = metadata
+
+	return metadata
+
+async def list_documents(project_id, knowledge_base_id):
+	"""Lists the Documents belonging to a Knowledge base as DocumentEntry records.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base."""
+	client = get_async_client(dialogflow.DocumentsAsyncClient)
+	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(project_id, knowledge_base_id)
+	generation = document_utils.get_document_generation(knowledge_base_id)
+
+	try:
+		entries = []
+
+		async for document in await client.list_documents(parent=knowledge_base_path):
+			entries.extend(document_utils.parse_document(document))
+	except Exception:
+		return []
+
+	document_utils.rebuild_document_index(knowledge_base_id, entries, generation)
+
+	return entries
+
+async def create_document(project_id, knowledge_base_id, display_name, mime_type, knowledge_type, content_uri=None, raw_content=None):
+	"""Creates a Document and returns its DocumentEntry records.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    display_name: The display name of the Document.
+	    mime_type: The mime_type of the Document. e.g. text/csv, text/html,
+	        text/plain, text/pdf etc.
+	    knowledge_type: The Knowledge type of the Document. e.g. FAQ,
+	        EXTRACTIVE_QA.
+	    content_uri: Uri of the document, e.g. gs://path/mydoc.csv,
+	        http://mypage.com/faq.html."""
+	client = get_async_client(dialogflow.DocumentsAsyncClient)
+	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(project_id, knowledge_base_id)
+
+	document = document_utils.build_document(display_name, mime_type, knowledge_type, content_uri, raw_content)
+
+	if document is None:
+		return None
+
+	operation = await client.create_document(parent=knowledge_base_path, document=document)
+	document = await asyncio.wait_for(operation.result(), timeout=120)
+
+	return document_utils.complete_create_document(knowledge_base_id, document)
+
+async def delete_document(project_id, knowledge_base_id, document_id):
+	"""Deletes a Document.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_id: Id of the Document."""
+	client = get_async_client(dialogflow.DocumentsAsyncClient)
+	document_path = dialogflow.DocumentsClient.document_path(project_id, knowledge_base_id, document_id)
+
+	operation = await client.delete_document(name=document_path)
+	await asyncio.wait_for(operation.result(), timeout=120)
+
+	document_utils.complete_delete_document(knowledge_base_id, document_id)
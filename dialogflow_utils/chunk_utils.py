@@ -0,0 +1,111 @@
+# Splitting of large EXTRACTIVE_QA files into several Documents.
+# Chunks follow the file's sections (headings in HTML, paragraphs in plain text) and are named after the file, so the
+# chunks of one file can be uploaded in parallel and still be shown and removed as one file.
+import os
+import re
+
+max_chunk_bytes = int(os.environ.get("FILE_CHUNK_BYTES", 256 * 1024))
+
+# Mime types that can be split, anything else (e.g. PDFs) is uploaded whole.
+CHUNKABLE_MIME = ["text/html", "text/plain"]
+
+# <file name>|part<n>of<total>
+chunk_name_pattern = re.compile(r"^(?P<file_name>.+)\|part(?P<part>\d+)of(?P<parts>\d+)$")
+
+html_section_pattern = re.compile(r"(?=<h[1-3][\s>])", re.IGNORECASE)
+paragraph_pattern = re.compile(r"(?<=\n\n)")
+
+def get_chunk_name(file_name, part, parts):
+	"""Gets the display name of a chunk, a file in one chunk keeps its own name.
+	Args:
+	    file_name: Name of the file.
+	    part: Index of the chunk, from 0.
+	    parts: Number of chunks."""
+	if parts == 1:
+		return file_name
+
+	return f"{file_name}|part{part + 1}of{parts}"
+
+def get_file_name(display_name):
+	"""Gets the name of the file a Document is a chunk of, its own display name if it isn't one.
+	Args:
+	    display_name: The display name of the Document."""
+	match = chunk_name_pattern.match(display_name)
+
+	return match.group("file_name") if match else display_name
+
+def get_chunk_part(display_name):
+	"""Gets the index of the chunk a Document is, from 0, or 0 if it isn't a chunk.
+	Args:
+	    display_name: The display name of the Document."""
+	match = chunk_name_pattern.match(display_name)
+
+	return int(match.group("part")) - 1 if match else 0
+
+def split_sections(text, mime_type):
+	"""Splits text at the start of each section, keeping every character."""
+	pattern = html_section_pattern if mime_type == "text/html" else paragraph_pattern
+
+	return [x for x in pattern.split(text) if x]
+
+def split_oversized(section):
+	"""Splits a section too large for one chunk at line breaks, and lines that are still too large by size."""
+	pieces = []
+
+	for line in section.splitlines(keepends=True):
+		encoded = line.encode("utf-8")
+
+		if len(encoded) <= max_chunk_bytes:
+			pieces.append(line)
+			continue
+
+		start = 0
+		while start < len(encoded):
+			end = min(start + max_chunk_bytes, len(encoded))
+
+			# Don't cut a multi-byte character in half.
+			while end < len(encoded) and end > start + 1 and encoded[end] & 0xC0 == 0x80:
+				end -= 1
+
+			pieces.append(encoded[start:end].decode("utf-8", errors="replace"))
+			start = end
+
+	return pieces
+
+def chunk_file(raw_content, mime_type):
+	"""Splits a file into chunks of at most FILE_CHUNK_BYTES, packing whole sections together where they fit.
+	Args:
+	    raw_content: Raw bytes of the file.
+	    mime_type: The mime type of the file.
+	Returns the chunks as bytes, the file itself if it is small enough or can't be split."""
+	if len(raw_content) <= max_chunk_bytes or mime_type not in CHUNKABLE_MIME:
+		return [raw_content]
+
+	text = raw_content.decode("utf-8", errors="replace")
+
+	pieces = []
+	for section in split_sections(text, mime_type):
+		if len(section.encode("utf-8")) > max_chunk_bytes:
+			pieces.extend(split_oversized(section))
+		else:
+			pieces.append(section)
+
+	chunks = []
+	current = []
+	current_size = 0
+
+	for piece in pieces:
+		size = len(piece.encode("utf-8"))
+
+		if current and current_size + size > max_chunk_bytes:
+			chunks.append("".join(current).encode("utf-8"))
+			current = []
+			current_size = 0
+
+		current.append(piece)
+		current_size += size
+
+	if current:
+		chunks.append("".join(current).encode("utf-8"))
+
+	return chunks
@@ -0,0 +1,79 @@
+import os
+import atexit
+import itertools
+import threading
+
+from google.cloud import dialogflow_v2beta1 as dialogflow
+
+DIALOGFLOW_HOST = "dialogflow.googleapis.com:443"
+
+# Number of gRPC channels (and clients) kept open per client type.
+channel_pool_size = int(os.environ.get("DIALOGFLOW_CHANNEL_POOL_SIZE", 2))
+
+# Keepalive pings stop idle channels from being silently dropped between questions.
+keepalive_time_ms = int(os.environ.get("DIALOGFLOW_KEEPALIVE_TIME_MS", 30000))
+keepalive_timeout_ms = int(os.environ.get("DIALOGFLOW_KEEPALIVE_TIMEOUT_MS", 10000))
+
+channel_options = [
+	("grpc.keepalive_time_ms", keepalive_time_ms),
+	("grpc.keepalive_timeout_ms", keepalive_timeout_ms),
+	("grpc.keepalive_permit_without_calls", 1),
+	("grpc.http2.max_pings_without_data", 0),
+	# Give every channel in the pool its own connection instead of a shared subchannel.
+	("grpc.use_local_subchannel_pool", 1),
+]
+
+client_pools = {}
+client_pools_lock = threading.Lock()
+
+def create_client(client_class):
+	"""Creates a client backed by its own long-lived gRPC channel.
+	Args:
+	    client_class: The Dialogflow client class, e.g. dialogflow.DocumentsClient."""
+	transport_class = client_class.get_transport_class("grpc")
+	channel = transport_class.create_channel(host=DIALOGFLOW_HOST, options=channel_options)
+
+	return client_class(transport=transport_class(host=DIALOGFLOW_HOST, channel=channel))
+
+def get_client(client_class):
+	"""Gets a shared client, round-robin across the channel pool.
+	Args:
+	    client_class: The Dialogflow client class, e.g. dialogflow.DocumentsClient."""
+	pool = client_pools.get(client_class)
+
+	if pool is None:
+		with client_pools_lock:
+			pool = client_pools.get(client_class)
+
+			if pool is None:
+				clients = [create_client(client_class) for _ in range(max(1, channel_pool_size))]
+				pool = (clients, itertools.cycle(clients))
+				client_pools[client_class] = pool
+
+	# itertools.cycle isn't thread-safe on its own.
+	with client_pools_lock:
+		return next(pool[1])
+
+def get_documents_client():
+	return get_client(dialogflow.DocumentsClient)
+
+def get_knowledge_bases_client():
+	return get_client(dialogflow.KnowledgeBasesClient)
+
+def get_sessions_client():
+	return get_client(dialogflow.SessionsClient)
+
+def close_clients():
+	"""Closes every pooled gRPC channel."""
+	with client_pools_lock:
+		pools = list(client_pools.values())
+		client_pools.clear()
+
+	for clients, _ in pools:
+		for client in clients:
+			try:
+				client.transport.grpc_channel.close()
+			except Exception:
+				pass
+
+atexit.register(close_clients)
@@ -1,14 +1,468 @@
 # https://github.com/googleapis/python-dialogflow/blob/master/samples/snippets/document_management.py
+import io
+import os
+import csv
+import time
+import hashlib
+import logging
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import LRUCache
 from google.cloud import dialogflow_v2beta1 as dialogflow
 
+from dialogflow_utils import chunk_utils, client_utils, retrieval_utils, similarity_utils
+from slack_utils import app_constants
+
+logger = logging.getLogger(__name__)
+
 KNOWLEDGE_TYPES = ['KNOWLEDGE_TYPE_UNSPECIFIED', 'FAQ', 'EXTRACTIVE_QA', 'ARTICLE_SUGGESTION']
 FAQ_MIME = ["text/csv"]
 EXTRACTIVE_QA_MIME = ["text/html", "text/plain", "application/pdf"]
 
-document_cache = {}
+DOCUMENT_TYPES = ["manual", "learned", "file"]
+
+# Only the fields needed to classify a Document, never its raw content.
+DOCUMENT_METADATA_FIELDS = "name,display_name,mime_type,knowledge_types"
+
+DocumentMetadata = collections.namedtuple("DocumentMetadata", ["document_id", "display_name", "document_type"])
+
+# (knowledge base id, document id) -> DocumentMetadata
+document_metadata_cache = LRUCache(maxsize=int(os.environ.get("DOCUMENT_METADATA_CACHE_SIZE", 16384)))
+
+class DocumentEntry:
+	"""What is kept of a listed or created Document, its raw content is parsed once and then dropped.
+	Entries have their question and answer, files have None for both.
+	An entry stored as a row of a shard Document has the display name it would have on its own, and shard_name is the
+	display name of the shard. The display name identifies an entry either way."""
+	__slots__ = ("document_id", "display_name", "document_type", "question", "answer", "shard_name")
+
+	def __init__(self, document_id, display_name, document_type, question=None, answer=None, shard_name=None):
+		self.document_id = document_id
+		self.display_name = display_name
+		self.document_type = document_type
+		self.question = question
+		self.answer = answer
+		self.shard_name = shard_name
+
+	def __eq__(self, other):
+		return isinstance(other, DocumentEntry) and self.display_name == other.display_name
+
+	def __hash__(self):
+		return hash(self.display_name)
+
+	def __repr__(self):
+		return f"DocumentEntry({self.document_id!r}, {self.display_name!r}, {self.document_type!r})"
+
+# Per knowledge base index of its documents, see new_document_index for the layout.
+document_index = {}
+document_index_lock = threading.RLock()
+
+# Per knowledge base counter bumped whenever its documents change, so answers derived from them can be invalidated.
+document_generations = {}
+
+# Bounded pool that the Documents of a chunked file are created and deleted on.
+document_executor = ThreadPoolExecutor(
+	max_workers=int(os.environ.get("DOCUMENT_WORKERS", 8)),
+	thread_name_prefix="document"
+)
+
+# How long a listed index is trusted before it is rebuilt, so changes made by other workers show up.
+document_index_ttl = int(os.environ.get("DOCUMENT_INDEX_TTL_SECONDS", 300))
+
+# Knowledge base ids being re-listed in the background by refresh_document_index.
+refreshing_indexes = set()
+
+def get_document_id(document):
+	"""Gets the Id of a Document from its full resource name.
+	Args:
+	    document: The Document."""
+	return document.name.rpartition("/")[2]
+
+def get_document_type(display_name):
+	"""Classifies a Document as a manual entry, learned entry or file.
+	Args:
+	    display_name: The display name of the Document."""
+	if display_name.startswith(app_constants.manual_entry_header):
+		return "manual"
+	elif display_name.startswith(app_constants.learned_entry_header):
+		return "learned"
+	else:
+		return "file"
+
+def is_shard(display_name):
+	"""Checks if a Document is a shard holding many entries, e.g. Manual_Entry|shard-<hash>.csv.
+	Args:
+	    display_name: The display name of the Document."""
+	return get_document_type(display_name) != "file" and os.path.splitext(display_name)[0].rpartition("|")[2].startswith("shard-")
+
+def get_entry_header(document_type):
+	return app_constants.learned_entry_header if document_type == "learned" else app_constants.manual_entry_header
+
+def format_entry(question, answer):
+	"""Formats an entry as the raw content of its own Document, "question","|answer".
+	The MD5 of this is the entry's uid, whether it is stored on its own or in a shard."""
+	return f'"{question}","|{answer}"'
+
+def get_entry_name(document_type, question, answer):
+	"""Gets the display name of an entry, e.g. Manual_Entry|<uid>.csv."""
+	uid = hashlib.md5(format_entry(question, answer).encode()).hexdigest()
+
+	return f"{get_entry_header(document_type)}|{uid}.csv"
+
+def format_shard(rows):
+	"""Formats (question, answer) rows as the raw content of a shard, a FAQ CSV with one entry per row."""
+	content = io.StringIO()
+	writer = csv.writer(content, quoting=csv.QUOTE_ALL, lineterminator="\n")
+
+	for question, answer in rows:
+		writer.writerow([question, f"|{answer}"])
+
+	return content.getvalue().encode("utf-8")
+
+def get_shard_name(document_type, raw_content):
+	"""Gets the display name of a shard, named after its content so a rewritten shard never shares a name."""
+	return f"{get_entry_header(document_type)}|shard-{hashlib.md5(raw_content).hexdigest()}.csv"
+
+def get_document_uid(display_name):
+	"""Gets the MD5 uid of an entry Document, files don't have one.
+	Args:
+	    display_name: The display name of the Document, e.g. Manual_Entry|<uid>.csv."""
+	if get_document_type(display_name) == "file":
+		return None
+
+	return os.path.splitext(display_name)[0].rpartition("|")[2]
+
+def get_entry_content(document):
+	"""Gets the (question, answer) of an entry Document.
+	Args:
+	    document: The entry Document, its raw content is formatted as "question","|answer"."""
+	# Get the text out of the file and remove the first and last quote.
+	raw_content = document.raw_content.decode("utf-8")[1:-1]
+
+	# Partition the text around the attempted unique separator.
+	question, sep, answer = raw_content.partition('","|')
+
+	return question, answer
+
+def parse_document(document):
+	"""Builds the DocumentEntry records of a Document, one per row of a shard and one for any other Document.
+	Args:
+	    document: The Document, as listed or created."""
+	document_id = get_document_id(document)
+	document_type = get_document_type(document.display_name)
+
+	if document_type == "file":
+		return [DocumentEntry(document_id, document.display_name, document_type)]
+
+	if not is_shard(document.display_name):
+		question, answer = get_entry_content(document)
+		return [DocumentEntry(document_id, document.display_name, document_type, question, answer)]
+
+	entries = []
+
+	for row in csv.reader(io.StringIO(document.raw_content.decode("utf-8"))):
+		if len(row) != 2:
+			continue
+
+		question, answer = row[0], row[1][1:] if row[1].startswith("|") else row[1]
+		entries.append(DocumentEntry(document_id, get_entry_name(document_type, question, answer), document_type, question, answer, document.display_name))
+
+	return entries
+
+def get_document_metadata_from(document):
+	"""Builds the DocumentMetadata of a Document.
+	Args:
+	    document: The Document."""
+	return DocumentMetadata(get_document_id(document), document.display_name, get_document_type(document.display_name))
+
+def new_document_index():
+	return {
+		"loaded_at": None,
+		# display name -> DocumentEntry
+		"documents": {},
+		# display name -> {document id: DocumentEntry}, of the names more than one Document lists, e.g. while a rewritten
+		# shard and the shard it replaces both exist
+		"copies": {},
+		# document id -> set of display names, more than one for a shard
+		"ids": {},
+		# entry uid -> display name
+		"uids": {},
+		# file name -> set of display names of its chunks
+		"files": {},
+		# document type -> set of display names
+		"types": {document_type: set() for document_type in DOCUMENT_TYPES}
+	}
+
+def add_to_index(index, knowledge_base_id, entry):
+	"""Adds a Document to an index, without touching the retrieval and similarity indexes."""
+	document_id = entry.document_id
+	name = entry.display_name
+	uid = get_document_uid(name)
+
+	with document_index_lock:
+		previous = index["documents"].get(name)
+
+		if previous is not None and previous.document_id != document_id:
+			copies = index["copies"].setdefault(name, {previous.document_id: previous})
+			copies[document_id] = entry
+		elif name in index["copies"]:
+			index["copies"][name][document_id] = entry
+
+		index["documents"][name] = entry
+		index["ids"].setdefault(document_id, set()).add(name)
+		index["types"][entry.document_type].add(name)
+
+		if uid is not None:
+			index["uids"][uid] = name
+
+		if entry.document_type == "file":
+			index["files"].setdefault(chunk_utils.get_file_name(name), set()).add(name)
+
+		document_metadata_cache[(knowledge_base_id, document_id)] = DocumentMetadata(document_id, entry.shard_name or name, entry.document_type)
+
+def index_document(knowledge_base_id, entry):
+	"""Adds a Document to its Knowledge base's index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    entry: The DocumentEntry to index."""
+	if entry.document_type != "file":
+		retrieval_utils.add_entry(knowledge_base_id, entry.display_name, entry.question, entry.answer, entry.document_type)
+		similarity_utils.add_entry(knowledge_base_id, entry.display_name, entry.question, entry.answer)
+
+	with document_index_lock:
+		add_to_index(document_index.setdefault(knowledge_base_id, new_document_index()), knowledge_base_id, entry)
+
+def unindex_document(knowledge_base_id, document_id):
+	"""Removes a Document, and every entry in it if it is a shard, from its Knowledge base's index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_id: Id of the Document.
+	Returns the DocumentEntry records that were removed."""
+	with document_index_lock:
+		document_metadata_cache.pop((knowledge_base_id, document_id), None)
+
+		index = document_index.get(knowledge_base_id)
+
+		if index is None:
+			return []
+
+		entries = []
+
+		for name in index["ids"].pop(document_id, ()):
+			copies = index["copies"].get(name)
+
+			# Another Document (e.g. the shard that replaced this one) still lists the entry, it stays indexed as that
+			# Document's.
+			if copies is not None:
+				copies.pop(document_id, None)
+
+				if copies:
+					index["documents"][name] = list(copies.values())[-1]
+
+					if len(copies) == 1:
+						index["copies"].pop(name)
+
+					continue
+
+				index["copies"].pop(name)
+
+			entry = index["documents"].get(name)
+
+			if entry is None or entry.document_id != document_id:
+				continue
+
+			entries.append(index["documents"].pop(name))
+			index["types"][entry.document_type].discard(name)
+
+			retrieval_utils.remove_entry(knowledge_base_id, name)
+			similarity_utils.remove_entry(knowledge_base_id, name)
+
+			uid = get_document_uid(name)
+			if uid is not None:
+				index["uids"].pop(uid, None)
+
+			if entry.document_type == "file":
+				file_name = chunk_utils.get_file_name(name)
+				chunks = index["files"].get(file_name, set())
+				chunks.discard(name)
+
+				if not chunks:
+					index["files"].pop(file_name, None)
+
+		return entries
+
+def drop_document_index(knowledge_base_id):
+	"""Forgets everything indexed for a Knowledge base.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base."""
+	with document_index_lock:
+		document_index.pop(knowledge_base_id, None)
+		retrieval_utils.drop_index(knowledge_base_id)
+		similarity_utils.drop_index(knowledge_base_id)
+		bump_document_generation(knowledge_base_id)
+
+def rebuild_document_index(knowledge_base_id, entries, generation):
+	"""Replaces a Knowledge base's index with a full listing of its Documents.
+	The retrieval and similarity indexes are built aside and swapped in, so questions never see half an index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    entries: The DocumentEntry of every Document in the Knowledge base.
+	    generation: The Knowledge base's generation read before listing."""
+	index = new_document_index()
+	retrieval_index = retrieval_utils.RetrievalIndex()
+	similarity_index = similarity_utils.SimilarityIndex()
+
+	for entry in entries:
+		if entry.document_type != "file":
+			retrieval_index.add(entry.display_name, entry.question, entry.answer, entry.document_type)
+			similarity_index.add(entry.display_name, entry.question, entry.answer)
+
+	with document_index_lock:
+		previous_index = document_index.get(knowledge_base_id)
+
+		# A Document created or deleted here while listing may be missing from the listing, keep the index we have and
+		# leave it stale so the next lookup lists again.
+		if previous_index is not None and get_document_generation(knowledge_base_id) != generation:
+			return
+
+		for entry in entries:
+			add_to_index(index, knowledge_base_id, entry)
+
+		document_index[knowledge_base_id] = index
+		retrieval_utils.set_index(knowledge_base_id, retrieval_index)
+		similarity_utils.set_index(knowledge_base_id, similarity_index)
+
+		index["loaded_at"] = time.monotonic()
+
+		# Only a listing that differs from what we knew (e.g. changed by another worker) invalidates answers. Document
+		# ids change whenever a Document is recreated, even under the same display name.
+		if previous_index is None or previous_index["ids"].keys() != index["ids"].keys():
+			bump_document_generation(knowledge_base_id)
+
+def get_document_generation(knowledge_base_id):
+	"""Gets the current generation of a Knowledge base's Documents.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base."""
+	with document_index_lock:
+		return document_generations.get(knowledge_base_id, 0)
+
+def bump_document_generation(knowledge_base_id):
+	"""Marks a Knowledge base's Documents as changed.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base."""
+	with document_index_lock:
+		document_generations[knowledge_base_id] = document_generations.get(knowledge_base_id, 0) + 1
+
+def is_index_fresh(index):
+	return index is not None and index["loaded_at"] is not None and time.monotonic() - index["loaded_at"] < document_index_ttl
+
+def get_document_index(project_id, knowledge_base_id):
+	"""Gets a Knowledge base's index, listing its Documents first if it isn't loaded or has gone stale.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base."""
+	with document_index_lock:
+		index = document_index.get(knowledge_base_id)
+
+		if is_index_fresh(index):
+			return index
+
+	list_documents(project_id, knowledge_base_id)
+
+	with document_index_lock:
+		return document_index.get(knowledge_base_id, new_document_index())
+
+def refresh_document_index(project_id, knowledge_base_id):
+	"""Re-lists a Knowledge base's Documents in the background if its index isn't loaded or has gone stale.
+	For the answer path, which must not wait on list_documents: until the listing is done the current index is used.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base."""
+	with document_index_lock:
+		if is_index_fresh(document_index.get(knowledge_base_id)) or knowledge_base_id in refreshing_indexes:
+			return
+
+		refreshing_indexes.add(knowledge_base_id)
+
+	def refresh():
+		try:
+			list_documents(project_id, knowledge_base_id)
+		finally:
+			with document_index_lock:
+				refreshing_indexes.discard(knowledge_base_id)
+
+	document_executor.submit(refresh)
+
+def get_all_documents(project_id, knowledge_base_id):
+	"""Gets the DocumentEntry of every Document in a Knowledge base without waiting on a re-list.
+	For display, e.g. the App Home: a stale index is used as it is while refresh_document_index re-lists it in the
+	background, only an index that was never listed is listed first.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base."""
+	with document_index_lock:
+		index = document_index.get(knowledge_base_id)
+		loaded = index is not None and index["loaded_at"] is not None
+
+	if loaded:
+		refresh_document_index(project_id, knowledge_base_id)
+	else:
+		index = get_document_index(project_id, knowledge_base_id)
+
+	with document_index_lock:
+		return list(index["documents"].values())
+
+def build_document(display_name, mime_type, knowledge_type, content_uri=None, raw_content=None):
+	"""Builds the Document to be created, None if there is no content.
+	Args:
+	    display_name: The display name of the Document.
+	    mime_type: The mime_type of the Document.
+	    knowledge_type: The Knowledge type of the Document.
+	    content_uri: Uri of the document.
+	    raw_content: Raw bytes of the document."""
+	if content_uri is not None:
+		document = dialogflow.Document(display_name=display_name, mime_type=mime_type, content_uri=content_uri)
+	elif raw_content is not None:
+		document = dialogflow.Document(display_name=display_name, mime_type=mime_type, raw_content=raw_content)
+	else:
+		return None
+
+	document.knowledge_types.append(getattr(dialogflow.Document.KnowledgeType, knowledge_type))
+
+	return document
+
+def begin_create_document(project_id, knowledge_base_id, display_name, mime_type, knowledge_type, content_uri=None, raw_content=None):
+	"""Starts creating a Document and returns the long-running operation, see create_document.
+	Pass the operation's result to complete_create_document once it is done."""
+	client = client_utils.get_documents_client()
+	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(project_id, knowledge_base_id)
+
+	document = build_document(display_name, mime_type, knowledge_type, content_uri, raw_content)
+
+	if document is None:
+		return None
+
+	return client.create_document(parent=knowledge_base_path, document=document)
+
+def complete_create_document(knowledge_base_id, document):
+	"""Records a newly created Document and returns its DocumentEntry records.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    document: The created Document."""
+	entries = parse_document(document)
+
+	for entry in entries:
+		index_document(knowledge_base_id, entry)
+
+	bump_document_generation(knowledge_base_id)
+
+	return entries
 
 def create_document(project_id, knowledge_base_id, display_name, mime_type, knowledge_type, content_uri=None, raw_content=None):
-	"""Creates a Document.
+	"""Creates a Document and returns its DocumentEntry records.
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base.
@@ -19,24 +473,84 @@ def create_document(project_id, knowledge_base_id, display_name, mime_type, know
 	        EXTRACTIVE_QA.
 	    content_uri: Uri of the document, e.g. gs://path/mydoc.csv,
 	        http://mypage.com/faq.html."""
-	client = dialogflow.DocumentsClient()
-	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(project_id, knowledge_base_id)
+	response = begin_create_document(project_id, knowledge_base_id, display_name, mime_type, knowledge_type, content_uri, raw_content)
 
-	if content_uri is not None:
-		document = dialogflow.Document(display_name=display_name, mime_type=mime_type, content_uri=content_uri)
-	elif raw_content is not None:
-		document = dialogflow.Document(display_name=display_name, mime_type=mime_type, raw_content=raw_content)
-	else:
+	if response is None:
 		return None
 
-	document.knowledge_types.append(getattr(dialogflow.Document.KnowledgeType, knowledge_type))
+	return complete_create_document(knowledge_base_id, response.result(timeout=120))
 
-	response = client.create_document(parent=knowledge_base_path, document=document)
-	document = response.result(timeout=120)
+def begin_create_file_documents(project_id, knowledge_base_id, file_name, mime_type, knowledge_type, raw_content):
+	"""Starts creating the Documents of a file, one per chunk, in parallel and returns their long-running operations.
+	Pass the operations' results to complete_create_document once they are done.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    file_name: Name of the file, the chunks are named after it.
+	    mime_type: The mime_type of the file.
+	    knowledge_type: The Knowledge type of the file.
+	    raw_content: Raw bytes of the whole file."""
+	chunks = chunk_utils.chunk_file(raw_content, mime_type)
 
-	document_cache[knowledge_base_id + "_" + document.display_name] = document
+	return gather_operations(project_id, knowledge_base_id, [
+		document_executor.submit(
+			begin_create_document,
+			project_id,
+			knowledge_base_id,
+			chunk_utils.get_chunk_name(file_name, i, len(chunks)),
+			mime_type,
+			knowledge_type,
+			raw_content=chunk
+		)
+		for i, chunk in enumerate(chunks)
+	])
 
-	return document
+def gather_operations(project_id, knowledge_base_id, futures):
+	"""Gets the create operations started in parallel by futures. If any of them couldn't be started, the Documents of
+	the others are deleted once created and the first error is raised, so a failed change leaves nothing behind."""
+	operations = []
+	errors = []
+
+	for future in futures:
+		try:
+			operations.append(future.result())
+		except Exception as e:
+			errors.append(e)
+
+	if errors:
+		rollback_create_documents(project_id, knowledge_base_id, operations)
+		raise errors[0]
+
+	return operations
+
+def rollback_create_documents(project_id, knowledge_base_id, operations):
+	"""Deletes the Documents of create operations started for a change that failed, each once its operation is done.
+	Operations that failed created nothing and are skipped.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    operations: The long-running create operations."""
+	for operation in operations:
+		if operation is not None:
+			operation.add_done_callback(lambda x: delete_created_document(project_id, knowledge_base_id, x))
+
+def delete_created_document(project_id, knowledge_base_id, operation):
+	if operation.exception() is not None:
+		return
+
+	document_id = get_document_id(operation.result())
+
+	try:
+		delete_document(project_id, knowledge_base_id, document_id)
+	except Exception as e:
+		logger.error(f"Failed to delete document {document_id} of {knowledge_base_id} after a failed change: {e}")
+
+def begin_delete_documents(project_id, knowledge_base_id, document_ids):
+	"""Starts deleting several Documents in parallel and returns their long-running operations.
+	Call complete_delete_document for each once they are done."""
+	futures = [document_executor.submit(begin_delete_document, project_id, knowledge_base_id, x) for x in document_ids]
+
+	return [x.result() for x in futures]
 
 def get_document_by_id(project_id, knowledge_base_id, document_id):
 	"""Gets a Document.
@@ -44,43 +558,130 @@ def get_document_by_id(project_id, knowledge_base_id, document_id):
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base.
 	    document_id: Id of the Document."""
-	client = dialogflow.DocumentsClient()
+	client = client_utils.get_documents_client()
 	document_path = client.document_path(project_id, knowledge_base_id, document_id)
 
 	response = client.get_document(name=document_path)
 
 	return response
 
+def get_document_metadata(project_id, knowledge_base_id, document_id):
+	"""Gets the display name and type of a Document without downloading its content.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_id: Id of the Document."""
+	with document_index_lock:
+		metadata = document_metadata_cache.get((knowledge_base_id, document_id))
+
+	if metadata is not None:
+		return metadata
+
+	client = client_utils.get_documents_client()
+	document_path = client.document_path(project_id, knowledge_base_id, document_id)
+
+	# The field mask keeps the response down to the metadata, raw_content is left behind.
+	document = client.get_document(name=document_path, metadata=[("x-goog-fieldmask", DOCUMENT_METADATA_FIELDS)])
+	metadata = get_document_metadata_from(document)
+
+	with document_index_lock:
+		document_metadata_cache[(knowledge_base_id, document_id)] = metadata
+
+	return metadata
+
 def get_document_by_name(project_id, knowledge_base_id, document_name):
-	"""Gets a Document.
+	"""Gets the DocumentEntry of a Document.
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base.
 	    document_name: Name of the Document."""
-	if knowledge_base_id + "_" + document_name in document_cache:
-		return document_cache[knowledge_base_id + "_" + document_name]
+	index = get_document_index(project_id, knowledge_base_id)
 
-	list_documents(project_id, knowledge_base_id)
+	with document_index_lock:
+		return index["documents"].get(document_name)
 
-	return document_cache.get(knowledge_base_id + "_" + document_name, None)
+def get_document_by_uid(project_id, knowledge_base_id, uid):
+	"""Gets the DocumentEntry of an entry Document by the MD5 uid of its content.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    uid: MD5 hex digest of the entry's raw content."""
+	index = get_document_index(project_id, knowledge_base_id)
+
+	with document_index_lock:
+		name = index["uids"].get(uid)
+
+		return index["documents"].get(name) if name is not None else None
+
+def get_file_documents(project_id, knowledge_base_id, file_name):
+	"""Gets the DocumentEntry of every chunk of a file, in chunk order.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    file_name: Name of the file."""
+	index = get_document_index(project_id, knowledge_base_id)
+
+	with document_index_lock:
+		entries = [index["documents"][x] for x in index["files"].get(file_name, ())]
+
+	return sorted(entries, key=lambda x: chunk_utils.get_chunk_part(x.display_name))
+
+def get_documents_by_type(project_id, knowledge_base_id, document_type):
+	"""Gets the DocumentEntry of every Document of one type.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_type: One of DOCUMENT_TYPES."""
+	index = get_document_index(project_id, knowledge_base_id)
+
+	with document_index_lock:
+		return [index["documents"][x] for x in index["types"][document_type]]
 
 def list_documents(project_id, knowledge_base_id):
-	"""Lists the Documents belonging to a Knowledge base.
+	"""Lists the Documents belonging to a Knowledge base as DocumentEntry records.
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base."""
-	client = dialogflow.DocumentsClient()
+	client = client_utils.get_documents_client()
 	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(project_id, knowledge_base_id)
+	generation = get_document_generation(knowledge_base_id)
 
 	try:
-		response = client.list_documents(parent=knowledge_base_path)
-
-		for document in response:
-			document_cache[knowledge_base_id + "_" + document.display_name] = document
+		# Parse each Document as it arrives so only one page of raw content is held at a time.
+		entries = [y for x in client.list_documents(parent=knowledge_base_path) for y in parse_document(x)]
 	except Exception:
-		response = []
+		return []
 
-	return response
+	rebuild_document_index(knowledge_base_id, entries, generation)
+
+	return entries
+
+def iter_documents(project_id, knowledge_base_id):
+	"""Yields the DocumentEntry records of a Knowledge base page by page, without building or touching its index.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base."""
+	client = client_utils.get_documents_client()
+	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(project_id, knowledge_base_id)
+
+	for document in client.list_documents(parent=knowledge_base_path):
+		yield from parse_document(document)
+
+def begin_delete_document(project_id, knowledge_base_id, document_id):
+	"""Starts deleting a Document and returns the long-running operation, see delete_document.
+	Call complete_delete_document once it is done."""
+	client = client_utils.get_documents_client()
+	document_path = client.document_path(project_id, knowledge_base_id, document_id)
+
+	return client.delete_document(name=document_path)
+
+def complete_delete_document(knowledge_base_id, document_id):
+	"""Forgets a deleted Document.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_id: Id of the Document."""
+	unindex_document(knowledge_base_id, document_id)
+	bump_document_generation(knowledge_base_id)
 
 def delete_document(project_id, knowledge_base_id, document_id):
 	"""Deletes a Document.
@@ -88,11 +689,7 @@ def delete_document(project_id, knowledge_base_id, document_id):
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base.
 	    document_id: Id of the Document."""
-	client = dialogflow.DocumentsClient()
-	document_path = client.document_path(project_id, knowledge_base_id, document_id)
-
-	document = client.get_document(name=document_path)
-	document_cache.pop(knowledge_base_id + "_" + document.display_name)
+	response = begin_delete_document(project_id, knowledge_base_id, document_id)
+	response.result(timeout=120)
 
-	response = client.delete_document(name=document_path)
-	response.result(timeout=120)
\ No newline at end of file
+	complete_delete_document(knowledge_base_id, document_id)
@@ -0,0 +1,84 @@
+# Downloads of files added with /add-file.
+# A quick probe reads only the headers, so the submission can be validated and acknowledged within Slack's deadline,
+# and the download itself is streamed in a background job with a size cap and a timeout.
+import os
+import time
+import posixpath
+import collections
+import urllib.error
+import urllib.parse
+import urllib.request
+
+max_file_bytes = int(os.environ.get("FILE_MAX_BYTES", 10 * 1024 * 1024))
+probe_timeout = float(os.environ.get("FILE_PROBE_TIMEOUT_SECONDS", 2))
+download_timeout = float(os.environ.get("FILE_DOWNLOAD_TIMEOUT_SECONDS", 60))
+chunk_size = 64 * 1024
+
+FileInfo = collections.namedtuple("FileInfo", ["file_name", "mime_type", "size"])
+
+def get_too_large_message():
+	return f"File is larger than {max_file_bytes / (1024 * 1024):g} MB."
+
+def get_file_info(url, response):
+	info = response.info()
+
+	# Servers that don't name the file get the last part of the url.
+	file_name = info.get_filename() or posixpath.basename(urllib.parse.urlparse(url).path) or None
+	size = info.get("Content-Length")
+
+	return FileInfo(file_name, info.get_content_type(), int(size) if size and size.isdigit() else None)
+
+def probe_file(url):
+	"""Gets the name, mime type and size of a file without downloading it.
+	Tries a HEAD request first, then a GET of the first byte for servers that don't allow HEAD.
+	Args:
+	    url: Direct link to the file.
+	Raises an exception if the file can't be reached or is larger than FILE_MAX_BYTES."""
+	try:
+		with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=probe_timeout) as response:
+			file_info = get_file_info(url, response)
+	except urllib.error.HTTPError:
+		with urllib.request.urlopen(urllib.request.Request(url, headers={"Range": "bytes=0-0"}), timeout=probe_timeout) as response:
+			# A ranged response's length is of the range, not the file.
+			file_info = get_file_info(url, response)._replace(size=None)
+
+	if file_info.size is not None and file_info.size > max_file_bytes:
+		raise ValueError(get_too_large_message())
+
+	return file_info
+
+def download_file(url, progress=None):
+	"""Streams a file into memory, giving up past FILE_MAX_BYTES or FILE_DOWNLOAD_TIMEOUT_SECONDS.
+	Args:
+	    url: Direct link to the file.
+	    progress: Called with (bytes received, total bytes or None) after each chunk."""
+	deadline = time.monotonic() + download_timeout
+	chunks = []
+	received = 0
+
+	with urllib.request.urlopen(url, timeout=download_timeout) as response:
+		size = get_file_info(url, response).size
+
+		if size is not None and size > max_file_bytes:
+			raise ValueError(get_too_large_message())
+
+		while True:
+			chunk = response.read(chunk_size)
+
+			if not chunk:
+				break
+
+			received += len(chunk)
+
+			if received > max_file_bytes:
+				raise ValueError(get_too_large_message())
+
+			if time.monotonic() > deadline:
+				raise TimeoutError("File download timed out.")
+
+			chunks.append(chunk)
+
+			if progress is not None:
+				progress(received, size)
+
+	return b"".join(chunks)
@@ -1,6 +1,101 @@
 # https://github.com/googleapis/python-dialogflow/blob/master/samples/snippets/detect_intent_knowledge.py
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import TTLCache
 from google.cloud import dialogflow_v2beta1 as dialogflow
 
+from dialogflow_utils import client_utils
+
+# (knowledge base id, normalized question) -> (document generation, formatted response)
+answer_cache = TTLCache(
+	maxsize=int(os.environ.get("ANSWER_CACHE_SIZE", 4096)),
+	ttl=int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 3600))
+)
+# Same for questions that couldn't be answered, kept briefly so an entry added for them soon shows up.
+unknown_answer_cache = TTLCache(
+	maxsize=int(os.environ.get("ANSWER_CACHE_SIZE", 4096)),
+	ttl=int(os.environ.get("ANSWER_MISS_TTL_SECONDS", 60))
+)
+answer_cache_lock = threading.Lock()
+
+# Sentence punctuation around a question, anything inside it (e.g. 2+2, C++) is kept.
+question_punctuation = " ?!.,;:'\""
+
+# Bounded pool that batches of questions are spread over.
+detect_intent_workers = int(os.environ.get("DETECT_INTENT_WORKERS", 8))
+detect_intent_executor = ThreadPoolExecutor(max_workers=detect_intent_workers, thread_name_prefix="detect-intent")
+
+def normalize_question(text):
+	"""Normalizes a question so trivial differences in case, spacing and trailing punctuation share a cache entry.
+	Args:
+	text: The question text.
+	"""
+	return " ".join(text.lower().split()).strip(question_punctuation)
+
+def get_cached_answer(knowledge_base_id, text, generation):
+	"""Returns a (found, response) tuple for a previously answered question.
+	Args:
+	knowledge_base_id: The Knowledge base's id the question was asked against.
+	text: The question text.
+	generation: The Knowledge base's current document generation, older answers are ignored.
+	"""
+	key = (knowledge_base_id, normalize_question(text))
+
+	with answer_cache_lock:
+		cached = answer_cache.get(key) or unknown_answer_cache.get(key)
+
+	if cached is None or cached[0] != generation:
+		return False, None
+
+	return True, cached[1]
+
+def cache_answer(knowledge_base_id, text, generation, response):
+	"""Caches the formatted response to a question.
+	Args:
+	knowledge_base_id: The Knowledge base's id the question was asked against.
+	text: The question text.
+	generation: The Knowledge base's document generation read before answering.
+	response: The formatted response, None if the question couldn't be answered.
+	"""
+	key = (knowledge_base_id, normalize_question(text))
+
+	with answer_cache_lock:
+		if response is None:
+			answer_cache.pop(key, None)
+			unknown_answer_cache[key] = (generation, response)
+		else:
+			unknown_answer_cache.pop(key, None)
+			answer_cache[key] = (generation, response)
+
+def build_detect_intent_request(session_path, language_code, knowledge_base_path, text):
+	"""Builds the detect intent request for a single text query."""
+	text_input = dialogflow.TextInput(text=text, language_code=language_code)
+
+	query_input = dialogflow.QueryInput(text=text_input)
+
+	query_params = dialogflow.QueryParameters(
+		knowledge_base_names=[knowledge_base_path]
+	)
+
+	return dialogflow.DetectIntentRequest(
+		session=session_path,
+		query_input=query_input,
+		query_params=query_params
+	)
+
+def detect_intent_knowledge_text(session_path, language_code, knowledge_base_path, text):
+	"""Returns the Knowledge answers for a single text query."""
+	session_client = client_utils.get_sessions_client()
+
+	request = build_detect_intent_request(session_path, language_code, knowledge_base_path, text)
+
+	response = session_client.detect_intent(request=request)
+
+	return response.query_result.knowledge_answers
+
 def detect_intent_knowledge(project_id, session_id, language_code, knowledge_base_id, texts):
 	"""Returns the result of detect intent with querying Knowledge Connector.
 	Args:
@@ -9,34 +104,31 @@ def detect_intent_knowledge(project_id, session_id, language_code, knowledge_bas
 	          allows continuation of the conversation.
 	language_code: Language of the queries.
 	knowledge_base_id: The Knowledge base's id to query against.
-	texts: A list of text queries to send.
+	texts: A list of text queries to send, sent concurrently on their own sessions if there are several.
+	Returns a list with the Knowledge answers of each text, in the same order.
 	"""
-	session_client = dialogflow.SessionsClient()
-
-	session_path = session_client.session_path(project_id, session_id)
-
-	for text in texts:
-		text_input = dialogflow.TextInput(text=text, language_code=language_code)
-
-		query_input = dialogflow.QueryInput(text=text_input)
+	knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(
+		project_id,
+		knowledge_base_id
+	)
 
-		knowledge_base_path = dialogflow.KnowledgeBasesClient.knowledge_base_path(
-			project_id,
-			knowledge_base_id
-		)
+	# A single question doesn't need to hop threads, and keeps the session so the conversation continues.
+	if len(texts) == 1:
+		session_path = dialogflow.SessionsClient.session_path(project_id, session_id)
+		return [detect_intent_knowledge_text(session_path, language_code, knowledge_base_path, texts[0])]
 
-		query_params = dialogflow.QueryParameters(
-			knowledge_base_names=[knowledge_base_path]
-		)
+	futures = [
+		detect_intent_executor.submit(detect_intent_knowledge_text, session_path, language_code, knowledge_base_path, text)
+		for session_path, text in zip(get_batch_session_paths(project_id, session_id, len(texts)), texts)
+	]
 
-		request = dialogflow.DetectIntentRequest(
-			session=session_path,
-			query_input=query_input,
-			query_params=query_params
-		)
+	return [future.result() for future in futures]
 
-		response = session_client.detect_intent(request=request)
-
-		knowledge_answers = response.query_result.knowledge_answers
-
-		return knowledge_answers
\ No newline at end of file
+def get_batch_session_paths(project_id, session_id, count):
+	"""Gets a session per text of a batch, Dialogflow doesn't order concurrent requests within one session.
+	Args:
+	project_id: The GCP project linked with the agent.
+	session_id: Id of the session the batch was sent on.
+	count: Number of texts in the batch.
+	"""
+	return [dialogflow.SessionsClient.session_path(project_id, f"{session_id}_{i}") for i in range(count)]
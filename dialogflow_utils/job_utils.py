@@ -0,0 +1,244 @@
+# Background jobs for Dialogflow long-running operations (document creation and deletion).
+# Workers start the operations and a single poller thread waits on them, so neither Slack request threads
+# nor workers sit blocked on operation.result(). Jobs are finished on a separate pool so the poller never waits on them.
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+job_queue = queue.Queue(maxsize=int(os.environ.get("JOB_QUEUE_SIZE", 256)))
+job_workers = int(os.environ.get("JOB_WORKERS", 4))
+
+job_poll_interval = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", 2))
+job_timeout = float(os.environ.get("JOB_TIMEOUT_SECONDS", 600))
+
+# team id -> jobs that haven't finished yet, in submission order.
+jobs = {}
+
+# Jobs whose operations have been started and are waiting to be polled.
+polling_jobs = []
+
+# team id -> the team's most recently failed Jobs, oldest first, kept until dismissed or they expire.
+failed_jobs = TTLCache(maxsize=10000, ttl=int(os.environ.get("JOB_FAILED_TTL_SECONDS", 86400)))
+failed_jobs_per_team = 5
+
+jobs_lock = threading.Lock()
+threads = []
+
+# Runs the finish functions and callbacks of polled jobs, which can make slow Dialogflow and Slack calls.
+finish_executor = ThreadPoolExecutor(max_workers=max(1, job_workers), thread_name_prefix="job-finish")
+
+# The job a worker thread is starting, so start functions can report progress.
+worker_state = threading.local()
+
+class JobBusy(Exception):
+	"""Raised by a start function whose job can't start yet, e.g. while another job holds a lock it needs.
+	The job goes back in the queue after JOB_POLL_INTERVAL_SECONDS instead of holding a worker or failing."""
+
+class Job:
+	"""A unit of background work for a team.
+	Args:
+	    team_id: The team the job belongs to.
+	    kind: What the job does, e.g. upload_file, upload_entry, remove_file, remove_entry.
+	    data: Whatever the App Home needs to display the job.
+	    start: Starts the work and returns the long-running operation(s) to wait on, if any.
+	    finish: Called with the operation results once they are all done.
+	    callback: Called with the job once it has finished, successfully or not.
+	    rollback: Called with the job's operations if it fails after starting them, to undo what they did."""
+
+	def __init__(self, team_id, kind, data, start, finish=None, callback=None, rollback=None):
+		self.id = uuid.uuid4().hex
+		self.team_id = team_id
+		self.kind = kind
+		self.data = data
+		self.start = start
+		self.finish = finish
+		self.callback = callback
+		self.rollback = rollback
+		self.status = "queued"
+		self.error = None
+		self.operations = []
+		self.deadline = None
+		# Percent of the job's own work done before its operations start, e.g. a file download.
+		self.progress = None
+
+def start_threads():
+	with jobs_lock:
+		if threads:
+			return
+
+		for i in range(max(1, job_workers)):
+			threads.append(threading.Thread(target=run_worker, name=f"job-worker-{i}", daemon=True))
+
+		threads.append(threading.Thread(target=run_poller, name="job-poller", daemon=True))
+
+		for thread in threads:
+			thread.start()
+
+def submit_job(team_id, kind, data, start, finish=None, callback=None, rollback=None):
+	"""Queues a Job, raises queue.Full if the queue is at capacity.
+	Args:
+	    See Job."""
+	start_threads()
+
+	job = Job(team_id, kind, data, start, finish, callback, rollback)
+
+	with jobs_lock:
+		jobs.setdefault(team_id, []).append(job)
+
+	try:
+		job_queue.put_nowait(job)
+	except queue.Full:
+		remove_job(job)
+		raise
+
+	return job
+
+def get_jobs(team_id, kind=None):
+	"""Gets the unfinished Jobs of a team.
+	Args:
+	    team_id: The team the jobs belong to.
+	    kind: Only return jobs of this kind."""
+	with jobs_lock:
+		return [x for x in jobs.get(team_id, []) if kind is None or x.kind == kind]
+
+def get_failed_jobs(team_id):
+	"""Gets the Jobs of a team that recently failed, oldest first."""
+	with jobs_lock:
+		return list(failed_jobs.get(team_id, []))
+
+def dismiss_failed_jobs(team_id):
+	"""Forgets the failed Jobs of a team once they have been seen."""
+	with jobs_lock:
+		failed_jobs.pop(team_id, None)
+
+def get_current_job():
+	"""Gets the Job whose start function is running on this thread, None outside of one."""
+	return getattr(worker_state, "job", None)
+
+def remove_job(job):
+	with jobs_lock:
+		team_jobs = jobs.get(job.team_id, [])
+
+		if job in team_jobs:
+			team_jobs.remove(job)
+
+		if not team_jobs:
+			jobs.pop(job.team_id, None)
+
+def complete_job(job, status, error=None):
+	job.status = status
+	job.error = error
+
+	if error is not None:
+		logger.error(f"Job {job.kind} for {job.team_id} failed: {error}")
+
+	remove_job(job)
+
+	if status == "failed":
+		with jobs_lock:
+			failed_jobs[job.team_id] = (failed_jobs.get(job.team_id, []) + [job])[-failed_jobs_per_team:]
+
+		if job.rollback is not None and job.operations:
+			try:
+				job.rollback(job.operations)
+			except Exception as e:
+				logger.error(f"Job {job.kind} rollback for {job.team_id} failed: {e}")
+
+	if job.callback is not None:
+		try:
+			job.callback(job)
+		except Exception as e:
+			logger.error(f"Job {job.kind} callback for {job.team_id} failed: {e}")
+
+def run_worker():
+	while True:
+		job = job_queue.get()
+
+		try:
+			job.status = "running"
+			worker_state.job = job
+			operations = job.start()
+
+			if operations is None:
+				operations = []
+			elif not isinstance(operations, list):
+				operations = [operations]
+
+			job.operations = operations
+		except JobBusy:
+			job.status = "queued"
+			requeue_job(job)
+			continue
+		except Exception as e:
+			complete_job(job, "failed", e)
+			continue
+		finally:
+			worker_state.job = None
+			job_queue.task_done()
+
+		if not job.operations:
+			finish_job(job, [])
+			continue
+
+		job.status = "polling"
+		job.deadline = time.monotonic() + job_timeout
+
+		with jobs_lock:
+			polling_jobs.append(job)
+
+def requeue_job(job):
+	# The job stays listed as queued while it waits, it counts against the queue again once it's back in.
+	timer = threading.Timer(job_poll_interval, job_queue.put, args=(job,))
+	timer.daemon = True
+	timer.start()
+
+def finish_job(job, results):
+	try:
+		if job.finish is not None:
+			job.finish(results)
+	except Exception as e:
+		complete_job(job, "failed", e)
+		return
+
+	complete_job(job, "done")
+
+def run_poller():
+	while True:
+		time.sleep(job_poll_interval)
+
+		with jobs_lock:
+			pending = list(polling_jobs)
+
+		for job in pending:
+			try:
+				done = all(operation.done() for operation in job.operations)
+
+				if not done and time.monotonic() < job.deadline:
+					continue
+
+				with jobs_lock:
+					polling_jobs.remove(job)
+
+				if not done:
+					finish_executor.submit(complete_job, job, "failed", TimeoutError("Operation timed out."))
+					continue
+
+				results = [operation.result() for operation in job.operations]
+			except Exception as e:
+				with jobs_lock:
+					if job in polling_jobs:
+						polling_jobs.remove(job)
+
+				finish_executor.submit(complete_job, job, "failed", e)
+				continue
+
+			finish_executor.submit(finish_job, job, results)
@@ -1,23 +1,78 @@
 # https://github.com/googleapis/python-dialogflow/blob/master/samples/snippets/knowledge_base_management.py
+import os
+import threading
+
+from cachetools import TTLCache
 from google.cloud import dialogflow_v2beta1 as dialogflow
 
-knowledge_base_cache = {}
+from dialogflow_utils import client_utils
+
+# Knowledge bases by display name (team id). Bounded, least recently used entries are evicted first.
+knowledge_base_cache = TTLCache(
+	maxsize=int(os.environ.get("KNOWLEDGE_BASE_CACHE_SIZE", 1024)),
+	ttl=int(os.environ.get("KNOWLEDGE_BASE_CACHE_TTL_SECONDS", 3600))
+)
+
+# Display names known not to have a knowledge base, kept briefly so a missing team doesn't trigger a listing per event.
+knowledge_base_miss_cache = TTLCache(
+	maxsize=int(os.environ.get("KNOWLEDGE_BASE_CACHE_SIZE", 1024)),
+	ttl=int(os.environ.get("KNOWLEDGE_BASE_MISS_TTL_SECONDS", 30))
+)
+
+knowledge_base_cache_lock = threading.Lock()
+
+# Only one thread lists the project's knowledge bases at a time, the rest wait for its result.
+knowledge_base_list_lock = threading.Lock()
+
+def cache_knowledge_base(knowledge_base):
+	"""Adds a Knowledge base to the cache.
+	Args:
+	    knowledge_base: The Knowledge base to cache."""
+	with knowledge_base_cache_lock:
+		knowledge_base_cache[knowledge_base.display_name] = knowledge_base
+		knowledge_base_miss_cache.pop(knowledge_base.display_name, None)
+
+def invalidate_knowledge_base(knowledge_base_name):
+	"""Removes a Knowledge base, and any cached miss for it, from the cache.
+	Args:
+	    knowledge_base_name: Display name of the Knowledge base."""
+	with knowledge_base_cache_lock:
+		knowledge_base_cache.pop(knowledge_base_name, None)
+		knowledge_base_miss_cache.pop(knowledge_base_name, None)
+
+def get_cached_knowledge_base(knowledge_base_name):
+	"""Gets a Knowledge base from the cache.
+	Args:
+	    knowledge_base_name: Display name of the Knowledge base.
+	Returns a (found, knowledge_base) tuple, found is False if the cache has no answer either way."""
+	with knowledge_base_cache_lock:
+		knowledge_base = knowledge_base_cache.get(knowledge_base_name)
+
+		if knowledge_base is not None:
+			return True, knowledge_base
+
+		if knowledge_base_name in knowledge_base_miss_cache:
+			return True, None
+
+	return False, None
 
 def create_knowledge_base(project_id, display_name):
 	"""Creates a Knowledge base.
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    display_name: The display name of the Knowledge base."""
-	client = dialogflow.KnowledgeBasesClient()
+	client = client_utils.get_knowledge_bases_client()
 	project_path = client.common_project_path(project_id)
 
 	knowledge_base = dialogflow.KnowledgeBase(display_name=display_name)
 
 	try:
 		response = client.create_knowledge_base(parent=project_path, knowledge_base=knowledge_base)
-		response.result(timeout=120)
 	except Exception:
-		response = None
+		invalidate_knowledge_base(display_name)
+		return None
+
+	cache_knowledge_base(response)
 
 	return response
 
@@ -26,7 +81,7 @@ def get_knowledge_base_by_id(project_id, knowledge_base_id):
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base."""
-	client = dialogflow.KnowledgeBasesClient()
+	client = client_utils.get_knowledge_bases_client()
 	knowledge_base_path = client.knowledge_base_path(project_id, knowledge_base_id)
 
 	try:
@@ -41,25 +96,42 @@ def get_knowledge_base_by_name(project_id, knowledge_base_name):
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_name: Display name of the Knowledge base."""
-	if knowledge_base_name in knowledge_base_cache:
-		return knowledge_base_cache[knowledge_base_name]
+	found, knowledge_base = get_cached_knowledge_base(knowledge_base_name)
+
+	if found:
+		return knowledge_base
 
-	list_knowledge_bases(project_id)
+	with knowledge_base_list_lock:
+		# Another thread may have finished a listing while we were waiting.
+		found, knowledge_base = get_cached_knowledge_base(knowledge_base_name)
 
-	return knowledge_base_cache.get(knowledge_base_name, None)
+		if found:
+			return knowledge_base
+
+		if list_knowledge_bases(project_id) is None:
+			# Don't cache a miss if the listing itself failed.
+			return None
+
+		with knowledge_base_cache_lock:
+			knowledge_base = knowledge_base_cache.get(knowledge_base_name)
+
+			if knowledge_base is None:
+				knowledge_base_miss_cache[knowledge_base_name] = True
+
+	return knowledge_base
 
 def list_knowledge_bases(project_id):
 	"""Gets a list of all Knowledge base.
 	Args:
 	    project_id: The GCP project linked with the agent."""
-	client = dialogflow.KnowledgeBasesClient()
+	client = client_utils.get_knowledge_bases_client()
 	project_path = client.common_project_path(project_id)
 
 	try:
-		response = client.list_knowledge_bases(parent=project_path)
+		response = [x for x in client.list_knowledge_bases(parent=project_path)]
 
 		for knowledge_base in response:
-			knowledge_base_cache[knowledge_base.display_name] = knowledge_base
+			cache_knowledge_base(knowledge_base)
 	except Exception:
 		response = None
 
@@ -70,7 +142,7 @@ def delete_knowledge_base(project_id, knowledge_base_id):
 	Args:
 	    project_id: The GCP project linked with the agent.
 	    knowledge_base_id: Id of the Knowledge base."""
-	client = dialogflow.KnowledgeBasesClient()
+	client = client_utils.get_knowledge_bases_client()
 	
 	knowledge_base_path = client.knowledge_base_path(project_id, knowledge_base_id)
 	
@@ -79,12 +151,10 @@ def delete_knowledge_base(project_id, knowledge_base_id):
 
 	knowledge_base = get_knowledge_base_by_id(project_id, knowledge_base_id)
 
-	from dialogflow_utils.document_utils import list_documents, document_cache
-	documents = list_documents(project_id, knowledge_base_id)
-
-	for document in documents:
-		document_cache.pop(knowledge_base_id + "_" + document.display_name)
+	client.delete_knowledge_base(request)
 
-	knowledge_base_cache.pop(knowledge_base.display_name)
+	from dialogflow_utils.document_utils import drop_document_index
+	drop_document_index(knowledge_base_id)
 
-	client.delete_knowledge_base(request)
\ No newline at end of file
+	if knowledge_base is not None:
+		invalidate_knowledge_base(knowledge_base.display_name)
@@ -0,0 +1,177 @@
+# Local TF-IDF retrieval over the questions of manual and learned entries.
+# A confident local match answers without a Dialogflow round trip, anything else falls back to Dialogflow.
+import os
+import re
+import math
+import threading
+
+import numpy
+from scipy import sparse
+
+# Minimum cosine similarity between a question and an entry's question to answer locally.
+local_answer_threshold = float(os.environ.get("LOCAL_ANSWER_THRESHOLD", 0.8))
+
+token_pattern = re.compile(r"[a-z0-9]+")
+
+# Question words (what, when, where, who, why, how, which) are kept, "When is the exam?" and "Where is the exam?"
+# ask different things.
+stop_words = {
+	"a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "i", "if", "in", "is",
+	"it", "me", "my", "of", "on", "or", "the", "this", "to", "we", "will", "with", "you", "your"
+}
+
+# knowledge base id -> RetrievalIndex
+retrieval_indexes = {}
+retrieval_lock = threading.Lock()
+
+def tokenize(text):
+	"""Splits text into lowercase terms, dropping stop words."""
+	return [x for x in token_pattern.findall(text.lower()) if x not in stop_words]
+
+class RetrievalIndex:
+	"""TF-IDF index over the entry questions of one knowledge base.
+	Term counts are computed once per entry; the vocabulary and sparse matrix are rebuilt lazily after entries change,
+	so terms only used by removed entries are dropped."""
+
+	def __init__(self):
+		# term -> column, of the terms of the entries the matrix was built from
+		self.vocabulary = {}
+		# entry name -> (term counts, answer, document type)
+		self.entries = {}
+		self.entry_names = []
+		self.matrix = None
+		self.idf = None
+		self.dirty = True
+
+	def add(self, entry_name, question, answer, document_type):
+		counts = {}
+
+		for term in tokenize(question):
+			counts[term] = counts.get(term, 0) + 1
+
+		self.entries[entry_name] = (counts, answer, document_type)
+		self.dirty = True
+
+	def remove(self, entry_name):
+		if self.entries.pop(entry_name, None) is not None:
+			self.dirty = True
+
+	def build(self):
+		self.entry_names = list(self.entries)
+		self.vocabulary = {}
+
+		rows, columns, values = [], [], []
+		for row, entry_name in enumerate(self.entry_names):
+			counts = self.entries[entry_name][0]
+			rows.extend([row] * len(counts))
+			columns.extend(self.vocabulary.setdefault(x, len(self.vocabulary)) for x in counts)
+			values.extend(counts.values())
+
+		shape = (len(self.entry_names), len(self.vocabulary))
+		counts = sparse.csr_matrix((numpy.array(values, dtype=numpy.float64), (rows, columns)), shape=shape)
+
+		# Smoothed inverse document frequency, as in scikit-learn's TfidfTransformer.
+		document_frequency = numpy.bincount(counts.indices, minlength=shape[1])
+		self.idf = numpy.log((1 + shape[0]) / (1 + document_frequency)) + 1
+
+		self.matrix = normalize_rows(counts.multiply(self.idf).tocsr())
+		self.dirty = False
+
+	def query(self, text):
+		"""Returns (entry name, score, answer, document type) of the closest entry, None if there are none."""
+		if not self.entries:
+			return None
+
+		if self.dirty:
+			self.build()
+
+		columns = {}
+		for term in tokenize(text):
+			column = self.vocabulary.get(term)
+
+			# Terms no entry has seen can't match, but they still dilute the query like they would in Dialogflow.
+			if column is None:
+				columns[-1] = columns.get(-1, 0) + 1
+			else:
+				columns[column] = columns.get(column, 0) + 1
+
+		known = {k: v * self.idf[k] for k, v in columns.items() if k >= 0}
+
+		if not known:
+			return None
+
+		unknown_weight = columns.get(-1, 0) * (math.log(1 + self.matrix.shape[0]) + 1)
+		norm = math.sqrt(sum(x * x for x in known.values()) + unknown_weight * unknown_weight)
+
+		query = numpy.zeros(self.matrix.shape[1])
+		query[list(known.keys())] = list(known.values())
+
+		scores = self.matrix.dot(query / norm)
+		best = int(numpy.argmax(scores))
+
+		counts, answer, document_type = self.entries[self.entry_names[best]]
+
+		return self.entry_names[best], float(scores[best]), answer, document_type
+
+def normalize_rows(matrix):
+	norms = numpy.sqrt(numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+	norms[norms == 0] = 1
+
+	return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+def add_entry(knowledge_base_id, entry_name, question, answer, document_type):
+	"""Adds an entry to a Knowledge base's retrieval index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    entry_name: Display name of the entry.
+	    question: The entry's question.
+	    answer: The entry's answer.
+	    document_type: manual or learned."""
+	with retrieval_lock:
+		retrieval_indexes.setdefault(knowledge_base_id, RetrievalIndex()).add(entry_name, question, answer, document_type)
+
+def remove_entry(knowledge_base_id, entry_name):
+	"""Removes an entry from a Knowledge base's retrieval index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    entry_name: Display name of the entry."""
+	with retrieval_lock:
+		index = retrieval_indexes.get(knowledge_base_id)
+
+		if index is not None:
+			index.remove(entry_name)
+
+def set_index(knowledge_base_id, index):
+	"""Replaces a Knowledge base's retrieval index with one built from a full listing.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    index: The RetrievalIndex."""
+	with retrieval_lock:
+		retrieval_indexes[knowledge_base_id] = index
+
+def drop_index(knowledge_base_id):
+	"""Forgets a Knowledge base's retrieval index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base."""
+	with retrieval_lock:
+		retrieval_indexes.pop(knowledge_base_id, None)
+
+def find_answer(knowledge_base_id, text):
+	"""Returns (answer, document type) of an entry that confidently matches the question, otherwise None.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    text: The question text."""
+	with retrieval_lock:
+		index = retrieval_indexes.get(knowledge_base_id)
+
+		if index is None:
+			return None
+
+		match = index.query(text)
+
+	if match is None or match[1] < local_answer_threshold:
+		return None
+
+	entry_name, score, answer, document_type = match
+
+	return answer, document_type
@@ -0,0 +1,229 @@
+# Sharded storage of manual and learned entries.
+# With ENTRY_SHARD_SIZE set, entries are stored as rows of FAQ CSV shard Documents instead of a Document each.
+# Adding or removing an entry rewrites only the shard it belongs to: the new shard is created, then the old one deleted.
+# Writes to one type of entry are serialized per Knowledge base and read the index under the lock, so none are lost.
+# A write that finds the lock taken goes back in the job queue rather than blocking a job worker.
+import os
+import queue
+import logging
+import threading
+
+from dialogflow_utils import document_utils, job_utils
+
+logger = logging.getLogger(__name__)
+
+# Entries per shard, 0 keeps one Document per entry.
+entry_shard_size = int(os.environ.get("ENTRY_SHARD_SIZE", 0))
+
+# Entries per shard written by an import when sharding isn't enabled.
+default_shard_size = 100
+
+# (knowledge base id, document type) -> lock held from the start of a shard write until its job has finished, it is
+# released by whichever thread finishes the job
+shard_locks = {}
+shard_locks_lock = threading.Lock()
+
+def is_enabled():
+	return entry_shard_size > 0
+
+def get_shard_lock(knowledge_base_id, document_type):
+	with shard_locks_lock:
+		return shard_locks.setdefault((knowledge_base_id, document_type), threading.Lock())
+
+def get_shards(project_id, knowledge_base_id, document_type):
+	"""Gets {shard document id: [DocumentEntry]} of the shards of one type of entry.
+	Args:
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_type: manual or learned."""
+	shards = {}
+
+	for entry in document_utils.get_documents_by_type(project_id, knowledge_base_id, document_type):
+		if entry.shard_name is not None:
+			shards.setdefault(entry.document_id, []).append(entry)
+
+	return shards
+
+def begin_write_shard(project_id, knowledge_base_id, document_type, rows):
+	"""Starts creating a shard of (question, answer) rows and returns the long-running operation."""
+	raw_content = document_utils.format_shard(rows)
+
+	return document_utils.begin_create_document(
+		project_id=project_id,
+		knowledge_base_id=knowledge_base_id,
+		display_name=document_utils.get_shard_name(document_type, raw_content),
+		mime_type="text/csv",
+		knowledge_type="FAQ",
+		raw_content=raw_content
+	)
+
+def begin_write_shards(project_id, knowledge_base_id, document_type, rows):
+	"""Starts creating as many shards as the rows need, in parallel, and returns their long-running operations.
+	New shards only, no existing shard is touched so no lock is needed. If any shard can't be started, the others are
+	deleted once created and the error is raised."""
+	size = entry_shard_size or default_shard_size
+	batches = [rows[i:i + size] for i in range(0, len(rows), size)]
+
+	futures = [document_utils.document_executor.submit(begin_write_shard, project_id, knowledge_base_id, document_type, x) for x in batches]
+
+	return document_utils.gather_operations(project_id, knowledge_base_id, futures)
+
+def retire_documents(team_id, project_id, knowledge_base_id, document_ids):
+	"""Deletes Documents whose entries were rewritten into new shards in a job of their own.
+	Each is unindexed once its deletion is done. Until then the new shard's entries already stand in for its entries in
+	the index, and a failed deletion is surfaced like any failed job."""
+	if not document_ids:
+		return
+
+	def finish(results):
+		for document_id in document_ids:
+			document_utils.complete_delete_document(knowledge_base_id, document_id)
+
+	try:
+		job_utils.submit_job(
+			team_id=team_id,
+			kind="retire_documents",
+			data=document_ids,
+			start=lambda: document_utils.begin_delete_documents(project_id, knowledge_base_id, document_ids),
+			finish=finish
+		)
+	except queue.Full:
+		logger.error(f"Job queue full, could not delete replaced documents {document_ids} of {knowledge_base_id}.")
+
+def submit_shard_job(team_id, knowledge_base_id, document_type, kind, data, start, finish, callback=None, rollback=None):
+	"""Submits a Job that holds the type's shard lock from its start until it has finished.
+	Args:
+	    See job_utils.Job, start and finish get a dict to keep state in between."""
+	lock = get_shard_lock(knowledge_base_id, document_type)
+	state = {}
+
+	def locked_start():
+		if not lock.acquire(blocking=False):
+			raise job_utils.JobBusy()
+
+		state["locked"] = True
+
+		return start(state)
+
+	def unlock(job):
+		if state.pop("locked", False):
+			lock.release()
+
+		if callback is not None:
+			callback(job)
+
+	return job_utils.submit_job(
+		team_id=team_id,
+		kind=kind,
+		data=data,
+		start=locked_start,
+		finish=lambda results: finish(state, results),
+		callback=unlock,
+		rollback=rollback
+	)
+
+def submit_add_entry(team_id, project_id, knowledge_base_id, learned, question, answer, callback=None):
+	"""Adds an entry to the fullest shard with room for it, or a new shard. Raises queue.Full like submit_job.
+	Args:
+	    team_id: The team the entry belongs to.
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    learned: Whether the entry was learned rather than added manually.
+	    question: The entry's question.
+	    answer: The entry's answer.
+	    callback: Called with the job once it has finished."""
+	document_type = "learned" if learned else "manual"
+	display_name = document_utils.get_entry_name(document_type, question, answer)
+
+	def start(state):
+		open_shards = [x for x in get_shards(project_id, knowledge_base_id, document_type).items() if len(x[1]) < entry_shard_size]
+		rows = []
+		state["replaced"] = []
+
+		if open_shards:
+			document_id, entries = max(open_shards, key=lambda x: len(x[1]))
+			rows = [(x.question, x.answer) for x in entries]
+			state["replaced"] = [document_id]
+
+		rows.append((question, answer))
+
+		return begin_write_shard(project_id, knowledge_base_id, document_type, rows)
+
+	def finish(state, results):
+		document_utils.complete_create_document(knowledge_base_id, results[0])
+		retire_documents(team_id, project_id, knowledge_base_id, state["replaced"])
+
+	return submit_shard_job(team_id, knowledge_base_id, document_type, "upload_entry", (learned, display_name, question, answer), start, finish, callback)
+
+def submit_remove_entry(team_id, project_id, knowledge_base_id, entry, callback=None):
+	"""Removes an entry, rewriting its shard without it or deleting the shard if it was the last entry in it.
+	Raises queue.Full like submit_job.
+	Args:
+	    team_id: The team the entry belongs to.
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    entry: The DocumentEntry to remove.
+	    callback: Called with the job once it has finished."""
+	def start(state):
+		# The shard may have been rewritten since the entry was looked up.
+		current = document_utils.get_document_by_name(project_id, knowledge_base_id, entry.display_name)
+
+		if current is None:
+			return None
+
+		state["replaced"] = [current.document_id]
+
+		rows = []
+		if current.shard_name is not None:
+			rows = [(x.question, x.answer) for x in get_shards(project_id, knowledge_base_id, entry.document_type).get(current.document_id, []) if x.display_name != entry.display_name]
+
+		if not rows:
+			state["deleted"] = current.document_id
+			return document_utils.begin_delete_document(project_id, knowledge_base_id, current.document_id)
+
+		return begin_write_shard(project_id, knowledge_base_id, entry.document_type, rows)
+
+	def finish(state, results):
+		if "deleted" in state:
+			document_utils.complete_delete_document(knowledge_base_id, state["deleted"])
+		elif results:
+			document_utils.complete_create_document(knowledge_base_id, results[0])
+			retire_documents(team_id, project_id, knowledge_base_id, state["replaced"])
+
+	return submit_shard_job(team_id, knowledge_base_id, entry.document_type, "remove_entry", entry, start, finish, callback)
+
+def submit_compaction(team_id, project_id, knowledge_base_id, document_type, callback=None):
+	"""Packs the entries of one type that aren't in a full shard, including ones stored as their own Document, into as
+	few shards as possible. Full shards are left alone. Raises queue.Full like submit_job.
+	Args:
+	    team_id: The team the entries belong to.
+	    project_id: The GCP project linked with the agent.
+	    knowledge_base_id: Id of the Knowledge base.
+	    document_type: manual or learned.
+	    callback: Called with the job once it has finished."""
+	def start(state):
+		full_shards = {x for x, entries in get_shards(project_id, knowledge_base_id, document_type).items() if len(entries) >= entry_shard_size}
+		loose = [x for x in document_utils.get_documents_by_type(project_id, knowledge_base_id, document_type) if x.document_id not in full_shards]
+
+		state["replaced"] = sorted({x.document_id for x in loose})
+
+		# Nothing to gain from rewriting a single shard.
+		if len(state["replaced"]) <= 1:
+			state["replaced"] = []
+			return None
+
+		rows = [(x.question, x.answer) for x in sorted(loose, key=lambda x: x.display_name)]
+
+		return begin_write_shards(project_id, knowledge_base_id, document_type, rows)
+
+	def finish(state, results):
+		for document in results:
+			document_utils.complete_create_document(knowledge_base_id, document)
+
+		retire_documents(team_id, project_id, knowledge_base_id, state["replaced"])
+
+	# Shards written before one failed are deleted, the entries they took over are still in the shards being replaced.
+	def rollback(operations):
+		document_utils.rollback_create_documents(project_id, knowledge_base_id, operations)
+
+	return submit_shard_job(team_id, knowledge_base_id, document_type, "compact_entries", document_type, start, finish, callback, rollback)
@@ -0,0 +1,155 @@
+# Near-duplicate detection for entries using MinHash signatures of word shingles and LSH banding.
+# Candidates come from the LSH buckets of the question, so finding similar entries doesn't scan the whole knowledge base.
+# An entry is only a duplicate if its answer is similar too, a question that looks alike but gets a different answer
+# (e.g. homework 3 and homework 4) is a different entry.
+import os
+import re
+import zlib
+import threading
+
+import numpy
+
+# Estimated Jaccard similarity of two questions' (and answers') word shingles at which they count as duplicates.
+duplicate_threshold = float(os.environ.get("DUPLICATE_THRESHOLD", 0.85))
+
+# Words per shingle, pairs of words so a single changed word (a number, a question word) breaks two shingles.
+shingle_size = 2
+bands = 32
+rows = 4
+permutations = bands * rows
+
+# (a * x + b) mod prime, a is kept below 2**31 so the product can't overflow 64 bits.
+prime = numpy.uint64(4294967311)
+random_state = numpy.random.RandomState(1)
+coefficients_a = random_state.randint(1, 2 ** 31, size=permutations).astype(numpy.uint64)
+coefficients_b = random_state.randint(0, 2 ** 31, size=permutations).astype(numpy.uint64)
+
+# knowledge base id -> SimilarityIndex
+similarity_indexes = {}
+similarity_lock = threading.Lock()
+
+def get_shingles(text):
+	"""Gets the hashed word shingles of a normalized question or answer."""
+	words = re.sub(r"[^\w\s]", "", text.lower()).split()
+
+	if len(words) < shingle_size:
+		return {zlib.crc32(" ".join(words).encode())}
+
+	return {zlib.crc32(" ".join(words[i:i + shingle_size]).encode()) for i in range(len(words) - shingle_size + 1)}
+
+def get_signature(text):
+	"""Gets the MinHash signature of a question or answer."""
+	shingles = numpy.fromiter(get_shingles(text), dtype=numpy.uint64)
+	hashes = (numpy.outer(coefficients_a, shingles) + coefficients_b[:, None]) % prime
+
+	return hashes.min(axis=1)
+
+def get_similarity(signature, other):
+	"""Estimates the Jaccard similarity of two texts from their signatures."""
+	return float(numpy.mean(signature == other))
+
+class SimilarityIndex:
+	"""LSH index over the MinHash signatures of one knowledge base's entry questions."""
+
+	def __init__(self):
+		# entry name -> signature of the question
+		self.signatures = {}
+		# entry name -> signature of the answer
+		self.answer_signatures = {}
+		# (band, band bytes) -> set of entry names
+		self.buckets = {}
+
+	def get_bands(self, signature):
+		return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+
+	def add(self, entry_name, question, answer):
+		self.remove(entry_name)
+
+		signature = get_signature(question)
+		self.signatures[entry_name] = signature
+		self.answer_signatures[entry_name] = get_signature(answer)
+
+		for key in self.get_bands(signature):
+			self.buckets.setdefault(key, set()).add(entry_name)
+
+	def remove(self, entry_name):
+		signature = self.signatures.pop(entry_name, None)
+		self.answer_signatures.pop(entry_name, None)
+
+		if signature is None:
+			return
+
+		for key in self.get_bands(signature):
+			bucket = self.buckets.get(key)
+
+			if bucket is not None:
+				bucket.discard(entry_name)
+
+				if not bucket:
+					self.buckets.pop(key)
+
+	def query(self, question, answer, threshold):
+		"""Returns [(entry name, estimated similarity of the questions)] of the entries whose question and answer are both
+		at or above the threshold, most similar first."""
+		signature = get_signature(question)
+		answer_signature = get_signature(answer)
+
+		candidates = set()
+		for key in self.get_bands(signature):
+			candidates.update(self.buckets.get(key, ()))
+
+		matches = [(x, get_similarity(self.signatures[x], signature)) for x in candidates]
+		matches = [x for x in matches if x[1] >= threshold and get_similarity(self.answer_signatures[x[0]], answer_signature) >= threshold]
+
+		return sorted(matches, key=lambda x: x[1], reverse=True)
+
+def add_entry(knowledge_base_id, entry_name, question, answer):
+	"""Adds an entry to a Knowledge base's similarity index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    entry_name: Display name of the entry.
+	    question: The entry's question.
+	    answer: The entry's answer."""
+	with similarity_lock:
+		similarity_indexes.setdefault(knowledge_base_id, SimilarityIndex()).add(entry_name, question, answer)
+
+def remove_entry(knowledge_base_id, entry_name):
+	"""Removes an entry from a Knowledge base's similarity index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    entry_name: Display name of the entry."""
+	with similarity_lock:
+		index = similarity_indexes.get(knowledge_base_id)
+
+		if index is not None:
+			index.remove(entry_name)
+
+def set_index(knowledge_base_id, index):
+	"""Replaces a Knowledge base's similarity index with one built from a full listing.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    index: The SimilarityIndex."""
+	with similarity_lock:
+		similarity_indexes[knowledge_base_id] = index
+
+def drop_index(knowledge_base_id):
+	"""Forgets a Knowledge base's similarity index.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base."""
+	with similarity_lock:
+		similarity_indexes.pop(knowledge_base_id, None)
+
+def find_similar_entries(knowledge_base_id, question, answer, threshold=None):
+	"""Returns [(entry name, estimated similarity)] of entries that are near duplicates, in both question and answer.
+	Args:
+	    knowledge_base_id: Id of the Knowledge base.
+	    question: The new question.
+	    answer: The new answer.
+	    threshold: Minimum estimated Jaccard similarity, defaults to DUPLICATE_THRESHOLD."""
+	with similarity_lock:
+		index = similarity_indexes.get(knowledge_base_id)
+
+		if index is None:
+			return []
+
+		return index.query(question, answer, duplicate_threshold if threshold is None else threshold)
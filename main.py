@@ -1,12 +1,13 @@
 import os
 import re
-import urllib
+import hmac
+import queue
 import hashlib
 import logging
 
 from slack_bolt import App, BoltResponse
 
-from flask import Flask, request, make_response
+from flask import Flask, Response, request, make_response, jsonify, stream_with_context
 from slack_bolt.adapter.flask import SlackRequestHandler
 
 from slack_bolt.oauth.oauth_settings import OAuthSettings
@@ -15,15 +16,14 @@ from slack_bolt.oauth.callback_options import CallbackOptions, SuccessArgs, Fail
 from slack_sdk.oauth.installation_store.sqlalchemy import SQLAlchemyInstallationStore
 from slack_sdk.oauth.state_store.sqlalchemy import SQLAlchemyOAuthStateStore
 
-import sqlalchemy
-
-from slack_utils import app_constants
-from dialogflow_utils import knowledge_base_utils, document_utils, intent_utils
-
 from dotenv import load_dotenv
 
+# Before the utils are imported, they read their settings at import time.
 load_dotenv()
 
+from slack_utils import app_constants, db_utils, dispatch_utils, event_utils, export_utils, installation_utils, message_utils, permission_utils, render_utils
+from dialogflow_utils import knowledge_base_utils, chunk_utils, document_utils, download_utils, intent_utils, job_utils, retrieval_utils, shard_utils, similarity_utils
+
 # Globals
 
 logging.basicConfig(level=logging.DEBUG)
@@ -31,18 +31,29 @@ logger = logging.getLogger(__name__)
 
 project_id = os.environ.get("DIALOGFLOW_PROJECT_ID")
 
-# Cached changes for display updates.
-uploading_files = dict()
-uploading_entries = dict()
+# Public url of the app, used for export links.
+app_url = os.environ.get("APP_URL")
 
-removing_files = dict()
-removing_entries = dict()
+# Bearer token that /metrics requires, without one the route is disabled.
+metrics_token = os.environ.get("METRICS_TOKEN")
 
 # OAuth
 
-def success(args: SuccessArgs) -> BoltResponse:
-	team_id = args.installation.team_id
-
+oauth_scopes = [
+	"app_mentions:read",
+	"users:read",
+	"reactions:read",
+	"chat:write",
+	"im:write",
+	"reactions:write",
+	"channels:history",
+	"groups:history",
+	"im:history",
+	"mpim:history",
+	"commands"
+]
+
+def create_team_knowledge_base(team_id):
 	# Check for an existing knowledge base and create one if need be.
 	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
 		project_id=project_id,
@@ -55,21 +66,25 @@ def success(args: SuccessArgs) -> BoltResponse:
 			display_name=team_id
 		)
 
+def success(args: SuccessArgs) -> BoltResponse:
+	create_team_knowledge_base(args.installation.team_id)
+
 	return args.default.success(args)
 
 def failure(args: FailureArgs) -> BoltResponse:
 	return BoltResponse(status=args.suggested_status_code, body=args.reason)
 
 # App
-database_url = os.getenv("DATABASE_URL")
-if database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
+# No connection is opened here, the pool connects on first use.
+engine = db_utils.create_engine(db_utils.get_database_url())
 
-engine = sqlalchemy.create_engine(database_url)
-installation_store = SQLAlchemyInstallationStore(
-    client_id=os.environ.get("SLACK_CLIENT_ID"),
-    engine=engine,
-    logger=logger,
+# Bolt looks up the bot token of every event, serve those from memory.
+installation_store = installation_utils.CachedInstallationStore(
+	SQLAlchemyInstallationStore(
+		client_id=os.environ.get("SLACK_CLIENT_ID"),
+		engine=engine,
+		logger=logger,
+	)
 )
 
 oauth_state_store = SQLAlchemyOAuthStateStore(
@@ -78,11 +93,28 @@ oauth_state_store = SQLAlchemyOAuthStateStore(
     logger=logger,
 )
 
-try:
-    engine.execute("select count(*) from slack_bots")
-except Exception as e:
-    installation_store.metadata.create_all(engine)
-    oauth_state_store.metadata.create_all(engine)
+# Event ids already handled, shared by every worker when backed by the database.
+if os.environ.get("EVENT_STORE", "memory") == "sqlalchemy":
+	event_store = event_utils.SQLAlchemyEventStore(
+		engine=engine,
+		expiration_seconds=120,
+		cleanup_interval_seconds=int(os.environ.get("EVENT_STORE_CLEANUP_INTERVAL_SECONDS", 60)),
+		cleanup_batch_size=int(os.environ.get("EVENT_STORE_CLEANUP_BATCH_SIZE", 1000)),
+		logger=logger,
+	)
+else:
+	event_store = event_utils.MemoryEventStore(
+		max_len=int(os.environ.get("EVENT_STORE_MAX_LEN", 10000)),
+		max_age_seconds=120
+	)
+
+# Tables are created by `python manage.py init-db`, or on the first request unless DATABASE_AUTO_CREATE is false.
+database_auto_create = os.environ.get("DATABASE_AUTO_CREATE", "true").lower() == "true"
+database_stores = [installation_store, oauth_state_store]
+
+def ensure_database():
+	if database_auto_create:
+		db_utils.ensure_schema(engine, database_stores)
 
 app = App(
 	signing_secret=os.environ.get("SLACK_SIGNING_SECRET"),
@@ -90,18 +122,7 @@ app = App(
 	oauth_settings=OAuthSettings(
 		client_id=os.environ.get("SLACK_CLIENT_ID"),
 		client_secret=os.environ.get("SLACK_CLIENT_SECRET"),
-		scopes=[
-			"app_mentions:read",
-			"users:read",
-			"reactions:read",
-			"chat:write",
-			"im:write",
-			"reactions:write",
-			"channels:history",
-			"groups:history",
-			"im:history",
-			"mpim:history",
-			"commands"],
+		scopes=oauth_scopes,
 		user_scopes=[],
 		redirect_uri=None,
 		install_path="/slack/install",
@@ -116,27 +137,68 @@ app = App(
 flask_app = Flask(__name__)
 handler = SlackRequestHandler(app)
 
+@flask_app.before_request
+def before_request():
+	ensure_database()
+
 @flask_app.route("/")
 def homepage():
 	return "<h1>Online! 🤖</h1>"
 
-from expiringdict import ExpiringDict
-event_cache = ExpiringDict(max_len=100, max_age_seconds=120)
-
 @flask_app.route("/slack/events", methods=["POST"])
 def slack_events():
 	if not request.is_json:
 		return handler.handle(request)
 
 	event_id = request.get_json()["event_id"]
-	if event_id not in event_cache:
-		event_cache[event_id] = request
+	if event_store.add_if_absent(event_id):
 		response = handler.handle(request)
 	else:
 		response = make_response("", 429)
 		response.headers.add_header("X-Slack-No-Retry", 1)
 	return response
 
+@flask_app.route("/metrics", methods=["GET"])
+def metrics():
+	if not metrics_token:
+		return make_response("", 404)
+
+	if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {metrics_token}"):
+		return make_response("", 401)
+
+	return jsonify({
+		"message_filter": message_utils.get_counters(),
+		"app_home": render_utils.get_metrics(),
+		"slack_dispatch": dispatch_utils.get_metrics(),
+		"installation_store": installation_store.get_metrics()
+	})
+
+@flask_app.route("/export", methods=["GET"])
+def export():
+	team_id = request.args.get("team")
+
+	if not export_utils.verify_export(team_id, request.args.get("expires"), request.args.get("signature")):
+		return make_response("This link is invalid or has expired.", 403)
+
+	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
+		project_id=project_id,
+		knowledge_base_name=team_id
+	)
+
+	if existing_knowledge_base is None:
+		return make_response("", 404)
+
+	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
+
+	# Documents are listed and written out a page at a time, the whole knowledge base is never held at once.
+	entries = document_utils.iter_documents(project_id, knowledge_base_id)
+
+	return Response(
+		stream_with_context(export_utils.iter_csv(entries)),
+		mimetype="text/csv",
+		headers={"Content-Disposition": f"attachment; filename={team_id}-entries.csv"}
+	)
+
 @flask_app.route("/slack/install", methods=["GET"])
 def install():
 	return handler.handle(request)
@@ -149,7 +211,7 @@ def oauth_redirect():
 
 @app.command("/add-file")
 def add_file_command(ack, respond, body, client):
-	if not check_user_permission(client, body["user_id"]):
+	if not check_user_permission(client, body["team_id"], body["user_id"]):
 		ack()
 		return respond(app_constants.no_permission_command)
 
@@ -157,30 +219,164 @@ def add_file_command(ack, respond, body, client):
 
 @app.command("/add-entry")
 def add_entry_command(ack, respond, body, client):
-	if not check_user_permission(client, body["user_id"]):
+	if not check_user_permission(client, body["team_id"], body["user_id"]):
 		ack()
 		return respond(app_constants.no_permission_command)
 
 	add_entry(ack, body, client)
 
+@app.command("/compact-entries")
+def compact_entries_command(ack, respond, body, client, context):
+	ack()
+
+	team_id = body["team_id"]
+
+	if not check_user_permission(client, team_id, body["user_id"]):
+		return respond(app_constants.no_permission_command)
+
+	if not shard_utils.is_enabled():
+		return respond(app_constants.sharding_disabled)
+
+	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
+		project_id=project_id,
+		knowledge_base_name=team_id
+	)
+
+	if existing_knowledge_base is None:
+		return respond(app_constants.no_knowledge_base)
+
+	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
+
+	# Entries stored one per Document (e.g. from before sharding) are packed into shards in the background.
+	try:
+		for document_type in ["manual", "learned"]:
+			shard_utils.submit_compaction(
+				team_id=team_id,
+				project_id=project_id,
+				knowledge_base_id=knowledge_base_id,
+				document_type=document_type,
+				callback=lambda job: update_app_home(client, context)
+			)
+	except queue.Full:
+		return respond(app_constants.job_queue_full)
+
+	respond(app_constants.compacting_entries)
+
+@app.command("/import-entries")
+def import_entries_command(ack, respond, body, client, context):
+	ack()
+
+	team_id = body["team_id"]
+	url = body.get("text", "").strip()
+
+	if not check_user_permission(client, team_id, body["user_id"]):
+		return respond(app_constants.no_permission_command)
+
+	if not url:
+		return respond(app_constants.import_usage)
+
+	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
+		project_id=project_id,
+		knowledge_base_name=team_id
+	)
+
+	if existing_knowledge_base is None:
+		return respond(app_constants.no_knowledge_base)
+
+	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
+	summary = {}
+
+	def start():
+		rows = export_utils.parse_csv(download_utils.download_file(url))
+
+		# Skip entries that already exist, are being uploaded, or appear more than once in the file.
+		index = document_utils.get_document_index(project_id, knowledge_base_id)
+		uploading = {document_utils.get_document_uid(x[1]) for x in get_job_data(team_id, "upload_entry")}
+		seen = set()
+		new_rows = []
+
+		with document_utils.document_index_lock:
+			for question, answer in rows:
+				uid = document_utils.get_document_uid(document_utils.get_entry_name("manual", question, answer))
+
+				if uid in index["uids"] or uid in uploading or uid in seen:
+					continue
+
+				seen.add(uid)
+				new_rows.append((question, answer))
+
+		summary["imported"] = len(new_rows)
+		summary["skipped"] = len(rows) - len(new_rows)
+
+		return shard_utils.begin_write_shards(project_id, knowledge_base_id, "manual", new_rows)
+
+	def finish(results):
+		for document in results:
+			document_utils.complete_create_document(knowledge_base_id, document)
+
+	# A shard that fails takes the others with it, so a failed import can simply be run again.
+	def rollback(operations):
+		document_utils.rollback_create_documents(project_id, knowledge_base_id, operations)
+
+	def callback(job):
+		if job.status == "done":
+			respond(app_constants.import_done(summary["imported"], summary["skipped"]))
+		else:
+			respond(app_constants.import_failed)
+
+		# One App Home refresh for the whole import.
+		update_app_home(client, context)
+
+	try:
+		job_utils.submit_job(
+			team_id=team_id,
+			kind="import_entries",
+			data=url,
+			start=start,
+			finish=finish,
+			callback=callback,
+			rollback=rollback
+		)
+	except queue.Full:
+		return respond(app_constants.job_queue_full)
+
+	respond(app_constants.importing_entries)
+
+@app.command("/export-entries")
+def export_entries_command(ack, respond, body, client):
+	ack()
+
+	if not check_user_permission(client, body["team_id"], body["user_id"]):
+		return respond(app_constants.no_permission_command)
+
+	# Links can't be signed without a secret, verify_export would reject every one.
+	if not app_url or not export_utils.export_secret:
+		return respond(app_constants.export_unavailable)
+
+	respond(app_constants.export_link(export_utils.get_export_url(app_url, body["team_id"]), export_utils.export_link_ttl // 60))
+
 @app.command("/ping")
 def test_command(ack):
 	ack("Pong!")
 
 # Utilities
 
-def check_user_permission(client, user_id, minimum_permissions="admin"):
-	user_info = client.users_info(user=user_id)
+def check_user_permission(client, team_id, user_id, minimum_permissions="admin", priority=dispatch_utils.PRIORITY_INTERACTIVE):
+	user = permission_utils.get_user(client, team_id, user_id, priority)
 
 	if minimum_permissions == "admin":
-		return user_info["user"]["is_admin"]
+		return user["is_admin"]
 	elif minimum_permissions == "owner":
-		return user_info["user"]["is_owner"]
+		return user["is_owner"]
 	elif minimum_permissions == "primary_owner":
-		return user_info["user"]["is_primary_owner"]
+		return user["is_primary_owner"]
 	else:
 		return True
 
+def get_team_id(body):
+	# Slash commands carry team_id, interactive payloads a team object.
+	return body["team_id"] if "team_id" in body else body["team"]["id"]
+
 def get_dialogflow_response(text, team_id, user_id):
 	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
 		project_id=project_id,
@@ -192,16 +388,58 @@ def get_dialogflow_response(text, team_id, user_id):
 
 	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
 
-	detected_knowledge = intent_utils.detect_intent_knowledge(
-		project_id=project_id,
-		session_id=team_id + "_" + user_id,
-		language_code="en",
-		knowledge_base_id=knowledge_base_id,
-		texts=[text]
-	)
+	# Re-list the entry index in the background once it goes stale, until then questions use the index we have.
+	document_utils.refresh_document_index(project_id, knowledge_base_id)
+
+	# Read the generation before answering so an answer racing a document change is never served later.
+	generation = document_utils.get_document_generation(knowledge_base_id)
 
-	unknown_response = app_constants.get_unknown_answer_response()
+	found, response = intent_utils.get_cached_answer(knowledge_base_id, text, generation)
+
+	if not found:
+		response = get_local_answer(knowledge_base_id, text)
+
+	if not found and response is None:
+		detected_knowledge = intent_utils.detect_intent_knowledge(
+			project_id=project_id,
+			session_id=team_id + "_" + user_id,
+			language_code="en",
+			knowledge_base_id=knowledge_base_id,
+			texts=[text]
+		)[0]
 
+		response = format_knowledge_answer(text, knowledge_base_id, detected_knowledge)
+		intent_utils.cache_answer(knowledge_base_id, text, generation, response)
+
+	if response is None:
+		return app_constants.get_unknown_answer_response()
+
+	return response
+
+def get_local_answer(knowledge_base_id, text):
+	local_answer = retrieval_utils.find_answer(knowledge_base_id, text)
+
+	if local_answer is None:
+		return None
+
+	answer, document_type = local_answer
+
+	# For logging purposes (currently unused)
+	interaction = {
+				"question" : text,
+				"response" : answer,
+				"found" : True,
+				"sent" : True,
+				"document_type" : "Manual Entry" if document_type == "manual" else "Learned Entry",
+				"local" : True
+			}
+
+	if document_type == "manual":
+		return answer + app_constants.manual_entry_context_footer
+	else:
+		return answer + app_constants.learned_entry_context_footer
+
+def format_knowledge_answer(text, knowledge_base_id, detected_knowledge):
 	# If we got back a potential answer from the knowledge base, use it.
 	if detected_knowledge.answers:
 		best_answer = detected_knowledge.answers[0]
@@ -218,27 +456,27 @@ def get_dialogflow_response(text, team_id, user_id):
 			# For logging purposes (currently unused)
 			interaction = {
 					"question" : text,
-					"response" : unknown_response,
+					"response" : None,
 					"best_answer" : response,
 					"confidence" : str(best_answer.match_confidence_level),
 					"found" : True,
 					"sent" : False
 				}
 
-			return unknown_response
+			return None
 
-		document = document_utils.get_document_by_id(
+		document = document_utils.get_document_metadata(
 			project_id=project_id,
 			knowledge_base_id=knowledge_base_id,
 			document_id=best_answer.source.rpartition("/")[2]
 		)
 
 		# Add the context footer to the message depending on the source.
-		if document.display_name.startswith(app_constants.manual_entry_header):
+		if document.document_type == "manual":
 			footer = app_constants.manual_entry_context_footer
 			document_type = "Manual Entry"
 			response = response[1:]
-		elif document.display_name.startswith(app_constants.learned_entry_header):
+		elif document.document_type == "learned":
 			footer = app_constants.learned_entry_context_footer
 			document_type = "Learned Entry"
 			response = response[1:]
@@ -261,18 +499,18 @@ def get_dialogflow_response(text, team_id, user_id):
 		# For logging purposes (currently unused)
 		interaction = {
 					"question" : text,
-					"response" : unknown_response,
+					"response" : None,
 					"found" : False,
 					"sent" : False
 				}
 
-		return unknown_response
+		return None
 
 def upload_question_answer_pair(question, answer, client, context, ack=None, learned=False):
 	team_id = context["team_id"]
 
 	# Format the data within the file to allow for cleaner seperation later. We don't want to partition in the wrong place.
-	raw_content = f'"{question}","|{answer}"'
+	raw_content = document_utils.format_entry(question, answer)
 	uid = hashlib.md5(raw_content.encode()).hexdigest()
 
 	# Construct the filename using the appropriate entry header. This ensures it will be unique and identifiable.
@@ -291,20 +529,16 @@ def upload_question_answer_pair(question, answer, client, context, ack=None, lea
 
 	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
 
-	documents_response = document_utils.list_documents(
+	existing_document = document_utils.get_document_by_uid(
 		project_id=project_id,
-		knowledge_base_id=knowledge_base_id
+		knowledge_base_id=knowledge_base_id,
+		uid=uid
 	)
 
-	# Iterate over the documents to load them all in.
-	documents = [x for x in documents_response]
-
-	existing_document = [x for x in documents if os.path.splitext(x.display_name)[0].endswith(f"{uid}")]
-
-	if not existing_document and team_id in uploading_entries:
-		for document in uploading_entries[team_id]:
-			if os.path.splitext(document[1].display_name)[0].endswith(f"{uid}"):
-				existing_document = document
+	if not existing_document:
+		for entry in get_job_data(team_id, "upload_entry"):
+			if document_utils.get_document_uid(entry[1]) == uid:
+				existing_document = entry
 
 	# If this exact entry already exists, reject it.
 	if existing_document and ack:
@@ -313,47 +547,115 @@ def upload_question_answer_pair(question, answer, client, context, ack=None, lea
 	elif existing_document:
 		return False
 
-	if ack:
-		ack()
-
-	entry_data = (learned, file_name, question, answer)
-
-	# Cache that we are uploading the entry for local display purposes.
-	if team_id not in uploading_entries:
-		uploading_entries[team_id] = []
-	uploading_entries[team_id].append(entry_data)
-
-	update_app_home(client, context)
+	# Paraphrases of an entry we already know shouldn't pile up as separate learned entries. The reply is merged into
+	# the existing entry: nothing is uploaded, but it is reported as learned so the instructor still gets the reaction.
+	# A similar question with a different answer is a different entry and is learned as usual.
+	if learned:
+		similar_entries = similarity_utils.find_similar_entries(knowledge_base_id, question, answer)
 
-	document_utils.create_document(
-		project_id=project_id,
-		knowledge_base_id=knowledge_base_id,
-		display_name=file_name,
-		mime_type="text/csv",
-		knowledge_type="FAQ",
-		raw_content=raw_content.encode("utf-8")
-	)
+		if similar_entries:
+			logger.info(f"Merging learned entry for {team_id} into {similar_entries[0][0]}, it is a near duplicate.")
+			return True
 
-	# Remove the entry from the uploading cache and reupdate the app home.
-	uploading_entries[team_id].remove(entry_data)
+	# Upload the entry in the background, the job is what the app home displays in the meantime.
+	try:
+		if shard_utils.is_enabled():
+			shard_utils.submit_add_entry(
+				team_id=team_id,
+				project_id=project_id,
+				knowledge_base_id=knowledge_base_id,
+				learned=learned,
+				question=question,
+				answer=answer,
+				callback=lambda job: update_app_home(client, context)
+			)
+		else:
+			job_utils.submit_job(
+				team_id=team_id,
+				kind="upload_entry",
+				data=(learned, file_name, question, answer),
+				start=lambda: document_utils.begin_create_document(
+					project_id=project_id,
+					knowledge_base_id=knowledge_base_id,
+					display_name=file_name,
+					mime_type="text/csv",
+					knowledge_type="FAQ",
+					raw_content=raw_content.encode("utf-8")
+				),
+				finish=lambda results: document_utils.complete_create_document(knowledge_base_id, results[0]),
+				callback=lambda job: update_app_home(client, context)
+			)
+	except queue.Full:
+		if ack:
+			ack(response_action="errors", errors={"add-entry-input-question":app_constants.job_queue_full, "add-entry-input-answer":app_constants.job_queue_full})
+		return False
 
-	if not uploading_entries[team_id]:
-		uploading_entries.pop(team_id)
+	if ack:
+		ack()
 
 	update_app_home(client, context)
 
 	return True
 
+def get_job_data(team_id, kind):
+	return [x.data for x in job_utils.get_jobs(team_id, kind)]
+
+def get_job_status(job):
+	if job.status == "queued":
+		return "_Queued..._"
+	elif job.status == "running" and job.kind == "upload_file":
+		return "_Downloading..._" if job.progress is None else f"_Downloading... {job.progress}%_"
+
+	return "_Uploading..._"
+
+def get_job_description(job):
+	if job.kind == "upload_file":
+		return f"Adding the file *{job.data}*"
+	elif job.kind == "remove_file":
+		return f"Removing the file *{job.data}*"
+	elif job.kind == "upload_entry":
+		learned, display_name, question, answer = job.data
+		return f"Adding the entry _{question}_"
+	elif job.kind == "remove_entry":
+		return f"Removing the entry _{job.data.question}_"
+	elif job.kind == "compact_entries":
+		return f"Packing the {job.data} entries into shards"
+	elif job.kind == "import_entries":
+		return "Importing entries"
+	elif job.kind == "retire_documents":
+		return "Deleting the entry shards that were replaced"
+
+	return job.kind
+
+def get_failed_job_description(job):
+	# ValueErrors carry a message meant for the user, e.g. why a file was rejected.
+	if isinstance(job.error, ValueError):
+		return f"{get_job_description(job)}: {job.error}"
+
+	return get_job_description(job)
+
+def show_job_queue_full(client, team_id, body):
+	# App Home buttons have nowhere to respond to, so the message gets a modal.
+	dispatch_utils.submit(
+		team_id,
+		"views_open",
+		client.views_open,
+		trigger_id=body["trigger_id"],
+		view=app_constants.job_message_view(app_constants.job_queue_full),
+		priority=dispatch_utils.PRIORITY_INTERACTIVE
+	)
+
 def update_app_home(client, context):
+	# Refreshes are coalesced per user, bulk changes publish the latest state once.
 	team_id = context["team_id"]
 	user_id = context["user_id"]
 
+	render_utils.request_render(team_id, user_id, lambda: render_app_home(client, team_id, user_id))
+
+def render_app_home(client, team_id, user_id):
 	# Don't show the user if they don't have permission.
-	if not check_user_permission(client, user_id):
-		return client.views_publish(
-			user_id=user_id,
-			view=app_constants.app_home_no_permissions_view
-		)
+	if not check_user_permission(client, team_id, user_id, priority=dispatch_utils.PRIORITY_BACKGROUND):
+		return publish_app_home(client, team_id, user_id, app_constants.app_home_no_permissions_view)
 
 	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
 		project_id=project_id,
@@ -361,129 +663,176 @@ def update_app_home(client, context):
 	)
 
 	if existing_knowledge_base is None:
-		return client.views_publish(
-			user_id=user_id,
-			view=app_constants.app_home_no_knowledge_base_view
-		)
+		return publish_app_home(client, team_id, user_id, app_constants.app_home_no_knowledge_base_view)
 
 	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
 
-	# Get this workspace's documents and classify them.
-	documents_response = document_utils.list_documents(
+	# Get this workspace's documents from the index and classify them. Paging and searching don't list them again,
+	# changes made by other workers are picked up in the background once the index goes stale.
+	documents = document_utils.get_all_documents(
 		project_id=project_id,
 		knowledge_base_id=knowledge_base_id
 	)
 
-	# Iterate over the documents to load them all in.
-	documents = [x for x in documents_response]
+	# Get the pending entry uploads and removals if there are any.
+	uploading_entry_jobs = job_utils.get_jobs(team_id, "upload_entry")
+	uploaded_entries = [x.data for x in uploading_entry_jobs]
+	removed_entries = get_job_data(team_id, "remove_entry")
+
+	# Skip documents that are uploading, their jobs are displayed instead.
+	uploading_names = {x[1] for x in uploaded_entries}
 
-	# Get the cached entry uploads and removals if there are any.
-	uploaded_entries = uploading_entries.get(team_id, [])
-	removed_entries = removing_entries.get(team_id, [])
+	# Classify entries by their type. Remove any entries also currently being removed.
+	manual_entries = [x for x in documents if x.document_type == "manual" and x not in removed_entries and x.display_name not in uploading_names]
+	learned_entries = [x for x in documents if x.document_type == "learned" and x not in removed_entries and x.display_name not in uploading_names]
 
-	# Classify entries based on their header. Remove any entries also currently being removed.
-	manual_entries = [x for x in documents if x.display_name.startswith(app_constants.manual_entry_header) and x not in removed_entries]
-	learned_entries = [x for x in documents if x.display_name.startswith(app_constants.learned_entry_header) and x not in removed_entries]
+	# Get the pending file uploads and removals if there are any.
+	uploading_file_jobs = job_utils.get_jobs(team_id, "upload_file")
+	uploaded_files = [x.data for x in uploading_file_jobs]
+	removed_files = get_job_data(team_id, "remove_file")
 
-	# Get the cached file uploads and removals if there are any.
-	uploaded_files = uploading_files.get(team_id, [])
-	removed_files = removing_files.get(team_id, [])
+	# Anything that wasn't an entry was a file, the chunks of a file are shown as the one file. Remove any files also currently being removed.
+	file_names = dict.fromkeys(chunk_utils.get_file_name(x.display_name) for x in documents if x.document_type == "file")
+	files = [x for x in file_names if x not in removed_files and x not in uploaded_files]
 
-	# Anything that wasn't an entry was a file. Remove any files also currently being removed.
-	files = [x for x in documents if not x.display_name.startswith(app_constants.manual_entry_header) and not x.display_name.startswith(app_constants.learned_entry_header) and not x in removed_files]
+	# Each section lists its uploads first, then its documents.
+	manual_items = [x for x in uploading_entry_jobs if not x.data[0]] + manual_entries # if not learned
+	learned_items = [x for x in uploading_entry_jobs if x.data[0]] + learned_entries
+	file_items = uploading_file_jobs + files
+
+	state = render_utils.get_view_state(team_id, user_id)
+	query = state["query"]
 
 	view = {
 			"type": "home",
 			"blocks": []
 		}
 
+	# Background changes that failed stay at the top until dismissed.
+	failed_jobs = job_utils.get_failed_jobs(team_id)
+
+	if failed_jobs:
+		view["blocks"].append(app_constants.app_home_failed_jobs_view([get_failed_job_description(x) for x in failed_jobs]))
+		view["blocks"].append(app_constants.divide)
+
+	view["blocks"].append(app_constants.app_home_search_view(query))
+
+	if query:
+		view["blocks"].append(app_constants.app_home_search_results_view(query))
+
+	view["blocks"].append(app_constants.divide)
+
 	# Add the Manual Entry section.
 	view["blocks"].append(app_constants.app_home_manual_entry_header_view)
 	view["blocks"].append(app_constants.app_home_add_manual_entry_button_view)
 	view["blocks"].append(app_constants.divide)
 
-	# Add uploading manual entries.
-	for entry in uploaded_entries:
-		learned, file_name, question, answer = entry
-		if not learned:
-			view["blocks"].append(app_constants.app_home_uploading_manual_entry_view(question, answer))
-			view["blocks"].append(app_constants.divide)
-
-	# Add each manual entry.
-	if manual_entries:
-		for document in manual_entries:
-			# Skip the ones that are uploading as we already displayed those.
-			for uploading_entry in uploaded_entries:
-				if document.display_name == uploading_entry[1]:
-					break
-			else:
-				# Get the text out of the file and remove the first and last quote.
-				raw_content = document.raw_content.decode("utf-8")[1:-1]
-				
-				# Partition the text around the attempted unique separator.
-				question, sep, answer = raw_content.partition('","|')
-				view["blocks"].append(app_constants.app_home_manual_entry_view(document.display_name, question, answer))
-				view["blocks"].append(app_constants.divide)
+	if manual_items:
+		add_app_home_page(view, "manual", filter_entry_items(manual_items, query), state, "entries", lambda x: app_constants.app_home_manual_entry_view(x.display_name, x.question, x.answer))
 
 	# Let the user know if they don't have any manual entries.
-	elif not [x for x in uploaded_entries if not x[0]]: # if not learned
+	else:
 		view["blocks"].append(app_constants.app_home_no_manual_entries_view)
 		view["blocks"].append(app_constants.divide)
 
 	# Add the Learned Entry section if there are any.
-	if learned_entries or [x for x in uploaded_entries if x[0]]:
+	if learned_items:
 		view["blocks"].append(app_constants.app_home_learned_entry_header_view)
 		view["blocks"].append(app_constants.divide)
 
-		# Add uploading learned entries.
-		for entry in uploaded_entries:
-			learned, file_name, question, answer = entry
-			if learned:
-				view["blocks"].append(app_constants.app_home_uploading_learned_entry_view(question, answer))
-				view["blocks"].append(app_constants.divide)
-
-		# Add each learned entry.
-		for document in learned_entries:
-			for uploading_entry in uploaded_entries:
-				# Skip the ones that are uploading as we already displayed those.
-				if document.display_name == uploading_entry[1]:
-					break
-			else:
-				raw_content = document.raw_content.decode("utf-8")[1:-1]
-				question, sep, answer = raw_content.partition('","|')
-				view["blocks"].append(app_constants.app_home_learned_entry_view(document.display_name, question, answer))
-				view["blocks"].append(app_constants.divide)
+		add_app_home_page(view, "learned", filter_entry_items(learned_items, query), state, "learned entries", lambda x: app_constants.app_home_learned_entry_view(x.display_name, x.question, x.answer))
 
 	# Add the File section.
 	view["blocks"].append(app_constants.app_home_file_header_view)
 	view["blocks"].append(app_constants.app_home_add_file_button_view)
 	view["blocks"].append(app_constants.divide)
 
-	# Add uploading files.
-	for document in uploaded_files:
-		view["blocks"].append(app_constants.app_home_uploading_file_view(document))
+	if file_items:
+		add_app_home_page(view, "files", filter_file_items(file_items, query), state, "files", app_constants.app_home_file_view)
+
+	# Let the user know if they don't have any files.
+	else:
+		view["blocks"].append(app_constants.app_home_no_files_view)
 		view["blocks"].append(app_constants.divide)
 
-	# Add each file.
-	if files:
-		for document in files:
-			for uploading_document in uploaded_files:
-				# Skip the ones that are uploading as we already displayed those.
-				if document.display_name == uploading_document:
-					break
+	publish_app_home(client, team_id, user_id, view)
+
+def filter_entry_items(items, query):
+	"""Keeps the uploading entry jobs and entry documents whose question or answer contains the search query."""
+	if not query:
+		return items
+
+	query = query.lower()
+	matches = []
+
+	for item in items:
+		if isinstance(item, job_utils.Job):
+			learned, file_name, question, answer = item.data
+		else:
+			question, answer = item.question, item.answer
+
+		if query in f"{question}\n{answer}".lower():
+			matches.append(item)
+
+	return matches
+
+def filter_file_items(items, query):
+	"""Keeps the uploading file jobs and file names that contain the search query."""
+	if not query:
+		return items
+
+	query = query.lower()
+
+	return [x for x in items if query in (x.data if isinstance(x, job_utils.Job) else x).lower()]
+
+def add_app_home_page(view, section, items, state, noun, document_view):
+	"""Adds the visible page of a section, only the blocks of that page are built.
+	Args:
+	    view: The App Home view being built.
+	    section: Name of the section, used by its paging buttons.
+	    items: Uploading jobs and documents (or file names) of the section that match the search.
+	    state: The user's view state from render_utils.
+	    noun: What the section's items are called in its count.
+	    document_view: Builds the block of a document or file name."""
+	if not items:
+		view["blocks"].append(app_constants.app_home_no_matches_view)
+		view["blocks"].append(app_constants.divide)
+		return
+
+	page_items, page, pages = render_utils.get_page(items, state["pages"].get(section, 0))
+	start = page * render_utils.page_size
+
+	view["blocks"].append(app_constants.app_home_section_count_view(start + 1, start + len(page_items), len(items), noun))
+
+	for item in page_items:
+		if not isinstance(item, job_utils.Job):
+			view["blocks"].append(document_view(item))
+		elif item.kind == "upload_file":
+			view["blocks"].append(app_constants.app_home_uploading_file_view(item.data, get_job_status(item)))
+		else:
+			learned, file_name, question, answer = item.data
+
+			if learned:
+				view["blocks"].append(app_constants.app_home_uploading_learned_entry_view(question, answer, get_job_status(item)))
 			else:
-				view["blocks"].append(app_constants.app_home_file_view(document.display_name))
-				view["blocks"].append(app_constants.divide)
+				view["blocks"].append(app_constants.app_home_uploading_manual_entry_view(question, answer, get_job_status(item)))
 
-	# Let the user know if they don't have any files.
-	elif team_id not in uploading_files:
-		view["blocks"].append(app_constants.app_home_no_files_view)
 		view["blocks"].append(app_constants.divide)
 
-	client.views_publish(
+	if pages > 1:
+		view["blocks"].append(app_constants.app_home_pagination_view(section, page, pages))
+		view["blocks"].append(app_constants.divide)
+
+def publish_app_home(client, team_id, user_id, view):
+	# App Home refreshes wait behind answers and interactive calls, and are skipped if nothing changed.
+	return render_utils.publish_if_changed(team_id, user_id, view, lambda view: dispatch_utils.call(
+		team_id,
+		"views_publish",
+		client.views_publish,
 		user_id=user_id,
-		view=view
-	)
+		view=view,
+		priority=dispatch_utils.PRIORITY_BACKGROUND
+	))
 
 # Event Listeners
 
@@ -491,6 +840,8 @@ def update_app_home(client, context):
 def handle_app_uninstalled(context):
 	team_id = context["team_id"]
 
+	permission_utils.invalidate_team(team_id)
+
 	# Delete installation / authentification data.
 	app.installation_store.delete_all(
 		enterprise_id=None,
@@ -513,8 +864,21 @@ def handle_app_uninstalled(context):
 		knowledge_base_id=knowledge_base_id
 	)
 
+@app.event("user_change")
+def handle_user_change(event, context):
+	# The event carries the updated user, use it instead of asking Slack again.
+	permission_utils.update_user(context["team_id"], event["user"])
+
+@app.event("team_join")
+def handle_team_join(event, context):
+	permission_utils.update_user(context["team_id"], event["user"])
+
 @app.event("app_home_opened")
 def handle_app_home_opened(client, event, context):
+	# The event only has a view once one was published, otherwise publish even if our hash says it's unchanged.
+	if event.get("view") is None:
+		render_utils.forget_published(context["team_id"], context["user_id"])
+
 	update_app_home(client, context)
 
 @app.event("app_mention")
@@ -523,79 +887,84 @@ def handle_mention(event, say):
 	team_id = event["team"]
 	user_id = event["user"]
 
-	say(get_dialogflow_response(text, team_id, user_id), thread_ts=event.get("thread_ts", None))
+	dispatch_utils.submit(
+		team_id,
+		"chat_postMessage",
+		say,
+		get_dialogflow_response(text, team_id, user_id),
+		thread_ts=event.get("thread_ts", None),
+		priority=dispatch_utils.PRIORITY_ANSWER
+	)
 
 @app.event("message")
 def handle_message(message, client, say, context, event):
-	if not "text" in message:
+	# Remember every message, it may be the question an instructor answers later.
+	message_utils.remember_message(message)
+
+	# Drop everything that can't be a question or an answer before making any API call.
+	kind = message_utils.classify_message(message)
+
+	if kind is None:
 		return
 
 	text = re.sub(app_constants.mention_pattern, '', message["text"])
-	team_id = message["team"]
+	team_id = message.get("team", context["team_id"])
 	user_id = message["user"]
 	ts = message["ts"]
 	channel_id = message["channel"]
 
 	# Check if someone direct messaged a question.
-	if message["channel_type"] == "im":
-		return say(get_dialogflow_response(text, team_id, user_id), thread_ts=message.get("thread_ts", None))
+	if kind == "question":
+		dispatch_utils.submit(
+			team_id,
+			"chat_postMessage",
+			say,
+			get_dialogflow_response(text, team_id, user_id),
+			thread_ts=message.get("thread_ts", None),
+			priority=dispatch_utils.PRIORITY_ANSWER
+		)
+
+		return
 
 	# Maybe an instructor was replying to a question? Check and see.
-	if not check_user_permission(client, user_id):
+	if not check_user_permission(client, team_id, user_id):
 		return
 
 	question = None
 	answer = None
 
-	message_link_search = app_constants.message_link_pattern.search(text)
-
 	# Check if this is a linked reply to a question.
-	if message_link_search:
-		groups = message_link_search.groupdict()
+	if kind == "linked_reply":
+		groups = app_constants.message_link_pattern.search(text).groupdict()
 
 		# Correct the ts value to the format Slack wants.
 		groups["ts"] = f"{groups['ts'][:-6]}.{groups['ts'][-6:]}"
 
 		# Get the linked message containing the question.
-		response = client.conversations_history(
-			channel=groups["channel"],
-			latest=groups["ts"],
-			inclusive=True,
-			limit=1
-		)
-
-		if response["ok"] and response["messages"]:
-			question = response["messages"][0]["text"]
-			answer = groups["answer"]
+		question = message_utils.get_message_text(client, team_id, groups["channel"], groups["ts"])
+		answer = groups["answer"]
 	# Check if this is a threaded reply to a question.
-	elif "thread_ts" in message and ts != message["thread_ts"]:
+	elif kind == "thread_reply":
 		# Get the parent message containing the question.
-		response = client.conversations_history(
-			channel=channel_id,
-			latest=message["thread_ts"],
-			inclusive=True,
-			limit=1
-		)
-
-		if response["ok"] and response["messages"]:
-			question = response["messages"][0]["text"]
-			answer = text
+		question = message_utils.get_message_text(client, team_id, channel_id, message["thread_ts"])
+		answer = text
 	# Check if this is a shared reply to a question.
-	elif "attachments" in message and message["attachments"]:
-		shared_message_attachment = message["attachments"][0]
-
-		if "text" in shared_message_attachment:
-			# Get the shared text containing the question.
-			question = shared_message_attachment["text"]
-			answer = text
+	elif kind == "shared_reply":
+		# Get the shared text containing the question.
+		question = message["attachments"][0]["text"]
+		answer = text
 
 	# If we found a valid answer, try to learn it and add a reaction to the answer message.
 	if question and answer:
 		if upload_question_answer_pair(question, answer, client, context, learned=True):
-			client.reactions_add(
+			dispatch_utils.submit(
+				team_id,
+				"reactions_add",
+				client.reactions_add,
 				channel=channel_id,
 				timestamp=ts,
 				name="brain",
+				priority=dispatch_utils.PRIORITY_BACKGROUND
 			)
 
 # Actions
@@ -604,15 +973,19 @@ def handle_message(message, client, say, context, event):
 def add_file(ack, body, client):
 	ack()
 
-	client.views_open(
+	dispatch_utils.submit(
+		get_team_id(body),
+		"views_open",
+		client.views_open,
 		trigger_id=body["trigger_id"],
-		view=app_constants.add_file_view
+		view=app_constants.add_file_view,
+		priority=dispatch_utils.PRIORITY_INTERACTIVE
 	)
 
 @app.action("remove_file")
-def remove_file(ack, context, payload, client):
+def remove_file(ack, body, context, payload, client):
 	team_id = context["team_id"]
-	document_name = payload["value"]
+	file_name = payload["value"]
 
 	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
 		project_id=project_id,
@@ -624,37 +997,40 @@ def remove_file(ack, context, payload, client):
 
 	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
 
-	document = document_utils.get_document_by_name(
+	# A large file was uploaded as several chunks, remove them all.
+	documents = document_utils.get_file_documents(
 		project_id=project_id,
 		knowledge_base_id=knowledge_base_id,
-		document_name=document_name
+		file_name=file_name
 	)
 
-	if document is None:
+	if not documents:
 		return
 
-	document_id = document.name.rpartition("/")[2]
-
-	ack()
-
-	# Cache that we are removing the file for local display purposes.
-	if team_id not in removing_files:
-		removing_files[team_id] = []
-	removing_files[team_id].append(document)
+	document_ids = [x.document_id for x in documents]
 
-	update_app_home(client, context)
+	def finish(results):
+		for document_id in document_ids:
+			document_utils.complete_delete_document(knowledge_base_id, document_id)
 
-	document_utils.delete_document(
-		project_id=project_id,
-		knowledge_base_id=knowledge_base_id,
-		document_id=document_id
-	)
-
-	# Remove the file from the removing cache and reupdate the app home.
-	removing_files[team_id].remove(document)
+	ack()
 
-	if not removing_files[team_id]:
-		removing_files.pop(team_id)
+	# Remove the file in the background, the job is what the app home displays in the meantime.
+	try:
+		job_utils.submit_job(
+			team_id=team_id,
+			kind="remove_file",
+			data=file_name,
+			start=lambda: document_utils.begin_delete_documents(
+				project_id=project_id,
+				knowledge_base_id=knowledge_base_id,
+				document_ids=document_ids
+			),
+			finish=finish,
+			callback=lambda job: update_app_home(client, context)
+		)
+	except queue.Full:
+		return show_job_queue_full(client, team_id, body)
 
 	update_app_home(client, context)
 
@@ -662,13 +1038,17 @@ def remove_file(ack, context, payload, client):
 def add_entry(ack, body, client):
 	ack()
 
-	client.views_open(
+	dispatch_utils.submit(
+		get_team_id(body),
+		"views_open",
+		client.views_open,
 		trigger_id=body["trigger_id"],
-		view=app_constants.add_entry_view
+		view=app_constants.add_entry_view,
+		priority=dispatch_utils.PRIORITY_INTERACTIVE
 	)
 
 @app.action("remove_entry")
-def remove_entry(ack, context, payload, client):
+def remove_entry(ack, body, context, payload, client):
 	team_id = context["team_id"]
 	document_name = payload["value"]
 
@@ -691,28 +1071,69 @@ def remove_entry(ack, context, payload, client):
 	if document is None:
 		return
 
-	document_id = document.name.rpartition("/")[2]
+	document_id = document.document_id
 
 	ack()
 
-	# Cache that we are removing the entry for local display purposes.
-	if team_id not in removing_entries:
-		removing_entries[team_id] = []
-	removing_entries[team_id].append(document)
+	# Remove the entry in the background, the job is what the app home displays in the meantime.
+	try:
+		# An entry in a shard is removed by rewriting the shard without it.
+		if document.shard_name is not None:
+			shard_utils.submit_remove_entry(
+				team_id=team_id,
+				project_id=project_id,
+				knowledge_base_id=knowledge_base_id,
+				entry=document,
+				callback=lambda job: update_app_home(client, context)
+			)
+		else:
+			job_utils.submit_job(
+				team_id=team_id,
+				kind="remove_entry",
+				data=document,
+				start=lambda: document_utils.begin_delete_document(
+					project_id=project_id,
+					knowledge_base_id=knowledge_base_id,
+					document_id=document_id
+				),
+				finish=lambda results: document_utils.complete_delete_document(knowledge_base_id, document_id),
+				callback=lambda job: update_app_home(client, context)
+			)
+	except queue.Full:
+		return show_job_queue_full(client, team_id, body)
 
 	update_app_home(client, context)
 
-	document_utils.delete_document(
-		project_id=project_id,
-		knowledge_base_id=knowledge_base_id,
-		document_id=document_id
-	)
+@app.action("dismiss_failed_jobs")
+def dismiss_failed_jobs(ack, context, client):
+	ack()
+
+	job_utils.dismiss_failed_jobs(context["team_id"])
+
+	update_app_home(client, context)
+
+@app.action(re.compile("^(next|previous)_page$"))
+def change_page(ack, context, payload, client):
+	ack()
+
+	section, page = payload["value"].split(":")
+	render_utils.set_page(context["team_id"], context["user_id"], section, int(page))
+
+	update_app_home(client, context)
+
+@app.action("search")
+def search(ack, context, payload, client):
+	ack()
+
+	render_utils.set_query(context["team_id"], context["user_id"], payload.get("value"))
 
-	# Remove the file from the removing cache and reupdate the app home.
-	removing_entries[team_id].remove(document)
+	update_app_home(client, context)
+
+@app.action("clear_search")
+def clear_search(ack, context, client):
+	ack()
 
-	if not removing_entries[team_id]:
-		removing_entries.pop(team_id)
+	render_utils.set_query(context["team_id"], context["user_id"], "")
 
 	update_app_home(client, context)
 
@@ -721,17 +1142,19 @@ def remove_entry(ack, context, payload, client):
 @app.view("add-file-submission")
 def view_add_file_submission(ack, client, view, context):
 	url = view["state"]["values"]["add-file-input"]["url"]["value"]
-	
+
+	# Only the headers are fetched here, Slack needs an ack within 3 seconds.
 	try:
-		response = urllib.request.urlopen(url)
+		file_info = download_utils.probe_file(url)
+	except ValueError as e:
+		ack(response_action="errors", errors={"add-file-input":str(e)})
+		return
 	except Exception:
 		ack(response_action="errors", errors={"add-file-input":"File could not be retrieved."})
 		return
 
-	raw_content = response.read()
-	file_info = response.info()
-	file_name = file_info.get_filename()
-	mime_type = file_info.get_content_type()
+	file_name = file_info.file_name
+	mime_type = file_info.mime_type
 
 	if mime_type in document_utils.FAQ_MIME:
 		knowledge_type = "FAQ"
@@ -741,59 +1164,78 @@ def view_add_file_submission(ack, client, view, context):
 		ack(response_action="errors", errors={"add-file-input":"Unknown file type"})
 		return
 
-	team_id = context["team_id"]
+	if not file_name:
+		ack(response_action="errors", errors={"add-file-input":"File has no name."})
+		return
 
-	existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
-		project_id=project_id,
-		knowledge_base_name=team_id
-	)
+	team_id = context["team_id"]
 
-	if existing_knowledge_base is None:
-		ack(response_action="errors", errors={"add-file-input":"This workspace has not been setup yet!"})
+	# A file that is already uploading is rejected here. Looking up the Knowledge base and its files can take a while,
+	# so the job does that and a failure shows up in the App Home.
+	if file_name in get_job_data(team_id, "upload_file"):
+		ack(response_action="errors", errors={"add-file-input":"This entry already exists!"})
 		return
 
-	knowledge_base_id = existing_knowledge_base.name.rpartition("/")[2]
+	state = {}
 
-	existing_document = document_utils.get_document_by_name(
-		project_id=project_id,
-		knowledge_base_id=knowledge_base_id,
-		document_name=file_name)
+	def start():
+		existing_knowledge_base = knowledge_base_utils.get_knowledge_base_by_name(
+			project_id=project_id,
+			knowledge_base_name=team_id
+		)
 
-	if not existing_document and team_id in uploading_files:
-		for document in uploading_files[team_id]:
-			if document == file_name:
-				existing_document = document
+		if existing_knowledge_base is None:
+			raise ValueError("This workspace has not been setup yet!")
 
-	# If this exact entry already exists, reject it.
-	if existing_document:
-		ack(response_action="errors", errors={"add-file-input":"This entry already exists!"})
+		knowledge_base_id = state["knowledge_base_id"] = existing_knowledge_base.name.rpartition("/")[2]
+
+		# If this exact file already exists, reject it.
+		if document_utils.get_file_documents(project_id=project_id, knowledge_base_id=knowledge_base_id, file_name=file_name):
+			raise ValueError("This file already exists!")
+
+		return document_utils.begin_create_file_documents(
+			project_id=project_id,
+			knowledge_base_id=knowledge_base_id,
+			file_name=file_name,
+			mime_type=mime_type,
+			knowledge_type=knowledge_type,
+			raw_content=download_utils.download_file(url, lambda received, total: update_download_progress(client, context, received, total))
+		)
+
+	def finish(results):
+		for document in results:
+			document_utils.complete_create_document(state["knowledge_base_id"], document)
+
+	# Download and upload the file in the background, the job is what the app home displays in the meantime.
+	# Large files are split into chunks that are uploaded in parallel. If any chunk fails, the others are deleted.
+	try:
+		job_utils.submit_job(
+			team_id=team_id,
+			kind="upload_file",
+			data=file_name,
+			start=start,
+			finish=finish,
+			callback=lambda job: update_app_home(client, context),
+			rollback=lambda operations: document_utils.rollback_create_documents(project_id, state["knowledge_base_id"], operations)
+		)
+	except queue.Full:
+		ack(response_action="errors", errors={"add-file-input":app_constants.job_queue_full})
 		return
 
 	ack()
 
-	# Cache that we are uploading the file for local display purposes.
-	if team_id not in uploading_files:
-		uploading_files[team_id] = []
-	uploading_files[team_id].append(file_name)
-
 	update_app_home(client, context)
 
-	document_utils.create_document(
-		project_id=project_id,
-		knowledge_base_id=knowledge_base_id,
-		display_name=file_name,
-		mime_type=mime_type,
-		knowledge_type=knowledge_type,
-		raw_content=raw_content
-	)
-
-	# Remove the file from the uploading cache and reupdate the app home.
-	uploading_files[team_id].remove(file_name)
+def update_download_progress(client, context, received, total):
+	job = job_utils.get_current_job()
 
-	if not uploading_files[team_id]:
-		uploading_files.pop(team_id)
+	# Without a length the progress can't be known, the job just shows as downloading.
+	progress = received * 100 // total if total else None
 
-	update_app_home(client, context)
+	# Refresh App Home every 10%, renders are coalesced anyway.
+	if job is not None and progress is not None and (job.progress is None or progress // 10 > job.progress // 10):
+		job.progress = progress
+		update_app_home(client, context)
 
 @app.view("add-entry-submission")
 def view_add_entry_submission(ack, client, body, view, context):
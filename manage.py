@@ -0,0 +1,55 @@
+# Database setup, run before the app starts serving, e.g. in the release phase: python manage.py init-db
+import os
+import sys
+import logging
+
+import click
+
+from slack_sdk.oauth.installation_store.sqlalchemy import SQLAlchemyInstallationStore
+from slack_sdk.oauth.state_store.sqlalchemy import SQLAlchemyOAuthStateStore
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from slack_utils import db_utils, event_utils
+
+logging.basicConfig(level=logging.INFO)
+
+def get_stores(engine):
+	"""Gets every store with tables in the database, the event store's too whichever EVENT_STORE is in use."""
+	return [
+		SQLAlchemyInstallationStore(client_id=os.environ.get("SLACK_CLIENT_ID"), engine=engine),
+		SQLAlchemyOAuthStateStore(expiration_seconds=120, engine=engine),
+		event_utils.SQLAlchemyEventStore(engine=engine),
+	]
+
+@click.group()
+def cli():
+	pass
+
+@cli.command("init-db")
+def init_db():
+	"""Creates the tables that don't exist yet, safe to run on every deploy."""
+	engine = db_utils.create_engine(db_utils.get_database_url())
+	stores = get_stores(engine)
+
+	missing = db_utils.get_missing_tables(engine, stores)
+	db_utils.create_schema(engine, stores)
+
+	click.echo(f"Created {', '.join(missing)}." if missing else "All tables exist.")
+
+@cli.command("check-db")
+def check_db():
+	"""Exits with an error if any table is missing."""
+	engine = db_utils.create_engine(db_utils.get_database_url())
+	missing = db_utils.get_missing_tables(engine, get_stores(engine))
+
+	if missing:
+		click.echo(f"Missing {', '.join(missing)}, run: python manage.py init-db", err=True)
+		sys.exit(1)
+
+	click.echo("All tables exist.")
+
+if __name__ == "__main__":
+	cli()
@@ -1,6 +1,8 @@
 import re
 import random
 
+from functools import lru_cache
+
 install_data_path = "./data/bolt-app-installation"
 
 # File-name headers for manual/learned entries
@@ -11,6 +13,48 @@ learned_entry_header = "Learned_Entry"
 no_permission_app_home = ":sweat: I'm sorry, you don't have permission to view this..."
 no_permission_command = ":sweat: I'm sorry, you don't have permission to do that..."
 
+# Background job messages
+job_queue_full = "Too many changes are in progress right now, please try again shortly."
+
+def job_message_view(text):
+	return {
+		"type": "modal",
+		"title": {
+			"type": "plain_text",
+			"text": "Classroom Assistant"
+		},
+		"close": {
+			"type": "plain_text",
+			"text": "Close"
+		},
+		"blocks": [
+			{
+				"type": "section",
+				"text": {
+					"type": "mrkdwn",
+					"text": text
+				}
+			}
+		]
+	}
+
+# /compact-entries messages
+sharding_disabled = "Entry sharding isn't enabled, set ENTRY_SHARD_SIZE to use it."
+no_knowledge_base = "This workspace has not been setup yet!"
+compacting_entries = ":package: Packing your entries into shards in the background..."
+
+# /import-entries and /export-entries messages
+import_usage = "Usage: `/import-entries <direct link to a CSV of question,answer rows>`"
+importing_entries = ":inbox_tray: Importing your entries in the background, I'll let you know when it's done..."
+import_failed = ":sweat: I'm sorry, the entries could not be imported."
+export_unavailable = "Exports aren't available, set APP_URL to the app's public url and EXPORT_SECRET (or SLACK_CLIENT_SECRET) to use them."
+
+def import_done(imported, skipped):
+	return f":white_check_mark: Imported {imported} entries, skipped {skipped} that already existed."
+
+def export_link(url, minutes):
+	return f":outbox_tray: <{url}|Download your entries> (the link works for {minutes} minutes)"
+
 # Context footers
 manual_entry_context_footer = "\n\n> :pencil: This information was provided to me manually by your instructor."
 learned_entry_context_footer = "\n\n> :brain: I learned this based on previous questions your instructor has answered."
@@ -191,15 +235,19 @@ app_home_add_manual_entry_button_view = {
 					}
 				}
 
-def app_home_uploading_manual_entry_view(question, answer):
+# Document blocks are cached and shared between renders, they must not be modified.
+app_home_fragment_cache_size = 4096
+
+def app_home_uploading_manual_entry_view(question, answer, status="_Uploading..._"):
 	return {
 		"type": "section",
 		"text": {
 			"type": "mrkdwn",
-			"text": f"_Uploading..._\n*Question:*\n> {question}\n*Answer:*\n> {answer}"
+			"text": f"{status}\n*Question:*\n> {question}\n*Answer:*\n> {answer}"
 		}
 	}
 
+@lru_cache(maxsize=app_home_fragment_cache_size)
 def app_home_manual_entry_view(file_name, question, answer):
 	return {
 		"type": "section",
@@ -256,15 +304,16 @@ app_home_learned_entry_header_view = {
 					}
 				}
 
-def app_home_uploading_learned_entry_view(question, answer):
+def app_home_uploading_learned_entry_view(question, answer, status="_Uploading..._"):
 	return {
 		"type": "section",
 		"text": {
 			"type": "mrkdwn",
-			"text": f"_Uploading..._\n*Question:*\n> {question}\n*Answer:*\n> {answer}"
+			"text": f"{status}\n*Question:*\n> {question}\n*Answer:*\n> {answer}"
 		}
 	}
 
+@lru_cache(maxsize=app_home_fragment_cache_size)
 def app_home_learned_entry_view(file_name, question, answer):
 	return {
 		"type": "section",
@@ -331,15 +380,16 @@ app_home_add_file_button_view = {
 					}
 				}
 
-def app_home_uploading_file_view(file_name):
+def app_home_uploading_file_view(file_name, status="_Uploading..._"):
 	return {
 		"type": "section",
 		"text": {
 			"type": "mrkdwn",
-			"text": f"_Uploading..._\n*{file_name}*"
+			"text": f"{status}\n*{file_name}*"
 		}
 	}
 
+@lru_cache(maxsize=app_home_fragment_cache_size)
 def app_home_file_view(file_name):
 	return {
 		"type": "section",
@@ -386,4 +436,124 @@ app_home_no_files_view = {
 						"text": ":open_file_folder: You don't have any files yet!",
 						"emoji": True
 					}
-				}
\ No newline at end of file
+				}
+
+def app_home_search_view(query=""):
+	element = {
+		"type": "plain_text_input",
+		"action_id": "search",
+		"placeholder": {
+			"type": "plain_text",
+			"text": "Search entries and files"
+		},
+		"dispatch_action_config": {
+			"trigger_actions_on": ["on_enter_pressed"]
+		}
+	}
+
+	if query:
+		element["initial_value"] = query
+
+	return {
+		"type": "input",
+		"block_id": "app-home-search",
+		"dispatch_action": True,
+		"element": element,
+		"label": {
+			"type": "plain_text",
+			"text": ":mag: Search"
+		}
+	}
+
+def app_home_search_results_view(query):
+	return {
+		"type": "section",
+		"text": {
+			"type": "mrkdwn",
+			"text": f"Showing results for *{query}*"
+		},
+		"accessory": {
+			"type": "button",
+			"text": {
+				"type": "plain_text",
+				"emoji": True,
+				"text": "Clear"
+			},
+			"value": "clear",
+			"action_id": "clear_search"
+		}
+	}
+
+def app_home_section_count_view(start, end, total, noun):
+	return {
+		"type": "context",
+		"elements": [
+			{
+				"type": "mrkdwn",
+				"text": f"Showing {start}-{end} of {total} {noun}" if total else f"0 {noun}"
+			}
+		]
+	}
+
+def app_home_pagination_view(section, page, pages):
+	elements = []
+
+	if page > 0:
+		elements.append({
+			"type": "button",
+			"text": {
+				"type": "plain_text",
+				"emoji": True,
+				"text": ":arrow_left: Previous"
+			},
+			"value": f"{section}:{page - 1}",
+			"action_id": "previous_page"
+		})
+
+	if page < pages - 1:
+		elements.append({
+			"type": "button",
+			"text": {
+				"type": "plain_text",
+				"emoji": True,
+				"text": "Next :arrow_right:"
+			},
+			"value": f"{section}:{page + 1}",
+			"action_id": "next_page"
+		})
+
+	return {
+		"type": "actions",
+		"block_id": f"{section}-pagination",
+		"elements": elements
+	}
+
+app_home_no_matches_view = {
+					"type": "section",
+					"text": {
+						"type": "plain_text",
+						"text": ":mag: Nothing here matches your search.",
+						"emoji": True
+					}
+				}
+
+def app_home_failed_jobs_view(descriptions):
+	lines = "\n".join(f"• {x}" for x in descriptions)
+
+	return {
+		"type": "section",
+		"text": {
+			"type": "mrkdwn",
+			"text": f":warning: *These changes didn't go through, please try them again:*\n{lines}"
+		},
+		"accessory": {
+			"type": "button",
+			"text": {
+				"type": "plain_text",
+				"emoji": True,
+				"text": "Dismiss"
+			},
+			"value": "dismiss",
+			"action_id": "dismiss_failed_jobs"
+		}
+	}
@@ -0,0 +1,55 @@
+# Async adapters so AsyncApp can share the sync SQLAlchemy stores used by main.py.
+import asyncio
+import functools
+
+from slack_sdk.oauth.installation_store.async_installation_store import AsyncInstallationStore
+from slack_sdk.oauth.state_store.async_state_store import AsyncOAuthStateStore
+
+async def run_in_thread(function, *args, **kwargs):
+	"""Runs a blocking function on the event loop's default executor."""
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+class AsyncInstallationStoreAdapter(AsyncInstallationStore):
+	"""Exposes a sync InstallationStore through the AsyncInstallationStore interface."""
+
+	def __init__(self, installation_store):
+		self.installation_store = installation_store
+
+	@property
+	def logger(self):
+		return self.installation_store.logger
+
+	async def async_save(self, installation):
+		return await run_in_thread(self.installation_store.save, installation)
+
+	async def async_find_bot(self, **kwargs):
+		return await run_in_thread(self.installation_store.find_bot, **kwargs)
+
+	async def async_find_installation(self, **kwargs):
+		return await run_in_thread(self.installation_store.find_installation, **kwargs)
+
+	async def async_delete_bot(self, **kwargs):
+		return await run_in_thread(self.installation_store.delete_bot, **kwargs)
+
+	async def async_delete_installation(self, **kwargs):
+		return await run_in_thread(self.installation_store.delete_installation, **kwargs)
+
+	async def async_delete_all(self, **kwargs):
+		return await run_in_thread(self.installation_store.delete_all, **kwargs)
+
+class AsyncOAuthStateStoreAdapter(AsyncOAuthStateStore):
+	"""Exposes a sync OAuthStateStore through the AsyncOAuthStateStore interface."""
+
+	def __init__(self, state_store):
+		self.state_store = state_store
+
+	@property
+	def logger(self):
+		return self.state_store.logger
+
+	async def async_issue(self, *args, **kwargs):
+		return await run_in_thread(self.state_store.issue, *args, **kwargs)
+
+	async def async_consume(self, state):
+		return await run_in_thread(self.state_store.consume, state)
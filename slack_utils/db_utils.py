@@ -0,0 +1,61 @@
+# Database engine and schema setup.
+# Nothing here connects at import time: the pool opens connections on first use, and the schema is either created by
+# `python manage.py init-db` (the release phase) or, unless DATABASE_AUTO_CREATE is off, on the first request.
+import os
+import threading
+
+import sqlalchemy
+
+schema_ready = False
+schema_lock = threading.Lock()
+
+def get_database_url():
+	database_url = os.getenv("DATABASE_URL")
+
+	# SQLAlchemy only accepts the postgresql:// scheme.
+	if database_url.startswith("postgres://"):
+		database_url = database_url.replace("postgres://", "postgresql://", 1)
+
+	return database_url
+
+def create_engine(database_url):
+	"""Creates the engine with its pool sized from the environment.
+	Size the pool to at least the number of threads that use it, e.g. waitress' --threads."""
+	# SQLite's pools don't take these settings.
+	if database_url.startswith("sqlite"):
+		return sqlalchemy.create_engine(database_url)
+
+	return sqlalchemy.create_engine(
+		database_url,
+		pool_size=int(os.environ.get("DATABASE_POOL_SIZE", 10)),
+		max_overflow=int(os.environ.get("DATABASE_MAX_OVERFLOW", 10)),
+		pool_timeout=int(os.environ.get("DATABASE_POOL_TIMEOUT_SECONDS", 30)),
+		pool_recycle=int(os.environ.get("DATABASE_POOL_RECYCLE_SECONDS", 1800)),
+		pool_pre_ping=os.environ.get("DATABASE_POOL_PRE_PING", "true").lower() == "true",
+	)
+
+def get_missing_tables(engine, stores):
+	"""Gets the names of the stores' tables that don't exist yet.
+	Args:
+	    engine: The engine of the database.
+	    stores: Stores with a SQLAlchemy metadata attribute, e.g. SQLAlchemyInstallationStore."""
+	inspector = sqlalchemy.inspect(engine)
+
+	return [x for store in stores for x in store.metadata.tables if not inspector.has_table(x)]
+
+def create_schema(engine, stores):
+	"""Creates the stores' tables that don't exist yet, existing tables are left alone."""
+	for store in stores:
+		store.metadata.create_all(engine)
+
+def ensure_schema(engine, stores):
+	"""Creates any missing tables once per process, the first time the database is needed."""
+	global schema_ready
+
+	if schema_ready:
+		return
+
+	with schema_lock:
+		if not schema_ready:
+			create_schema(engine, stores)
+			schema_ready = True
@@ -0,0 +1,220 @@
+# Rate-limit-aware dispatch of Slack Web API calls.
+# Every call waits for a token from its (team, method) bucket, sized after Slack's per-method tiers, and is run by a
+# small worker pool in priority order. A 429 blocks the bucket for Retry-After seconds and the call is retried.
+import os
+import time
+import heapq
+import queue
+import logging
+import itertools
+import threading
+import collections
+
+from concurrent.futures import Future
+
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first.
+PRIORITY_ANSWER = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BACKGROUND = 2
+
+# Requests per minute for each method, following Slack's rate limit tiers.
+method_rates = {
+	"chat_postMessage": 60,
+	"conversations_history": 50,
+	"reactions_add": 50,
+	"users_info": 100,
+	"views_open": 100,
+	"views_publish": 100,
+}
+default_rate = 20
+
+dispatch_workers = int(os.environ.get("SLACK_DISPATCH_WORKERS", 8))
+max_retries = int(os.environ.get("SLACK_DISPATCH_MAX_RETRIES", 3))
+
+dispatch_queue = queue.PriorityQueue()
+
+# Calls waiting for a token or a Retry-After to pass: (ready at, sequence, item)
+delayed_calls = []
+delayed_condition = threading.Condition()
+
+sequence = itertools.count()
+
+buckets = {}
+buckets_lock = threading.Lock()
+
+metrics = collections.Counter()
+metrics_lock = threading.Lock()
+
+threads = []
+threads_lock = threading.Lock()
+
+class TokenBucket:
+	"""Tokens refill continuously at the method's rate, with a burst of a few seconds' worth."""
+
+	def __init__(self, rate_per_minute):
+		self.rate = rate_per_minute / 60
+		self.capacity = max(1, self.rate * 5)
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self.blocked_until = 0
+		self.lock = threading.Lock()
+
+	def reserve(self):
+		"""Takes a token, returns how many seconds to wait first if none is available."""
+		with self.lock:
+			now = time.monotonic()
+
+			if now < self.blocked_until:
+				return self.blocked_until - now
+
+			self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+			self.updated = now
+
+			if self.tokens >= 1:
+				self.tokens -= 1
+				return 0
+
+			return (1 - self.tokens) / self.rate
+
+	def block(self, seconds):
+		with self.lock:
+			self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+			self.tokens = 0
+
+def count(name):
+	with metrics_lock:
+		metrics[name] += 1
+
+def get_metrics():
+	with delayed_condition:
+		delayed = len(delayed_calls)
+
+	with metrics_lock:
+		return {
+			"queue_depth": dispatch_queue.qsize(),
+			"delayed": delayed,
+			**metrics
+		}
+
+def get_bucket(team_id, method):
+	key = (team_id, method)
+
+	with buckets_lock:
+		bucket = buckets.get(key)
+
+		if bucket is None:
+			bucket = TokenBucket(method_rates.get(method, default_rate))
+			buckets[key] = bucket
+
+		return bucket
+
+def start_threads():
+	with threads_lock:
+		if threads:
+			return
+
+		for i in range(max(1, dispatch_workers)):
+			threads.append(threading.Thread(target=run_worker, name=f"slack-dispatch-{i}", daemon=True))
+
+		threads.append(threading.Thread(target=run_scheduler, name="slack-dispatch-scheduler", daemon=True))
+
+		for thread in threads:
+			thread.start()
+
+def enqueue(team_id, method, function, args, kwargs, priority):
+	start_threads()
+
+	future = Future()
+	item = {
+		"team_id": team_id,
+		"method": method,
+		"function": function,
+		"args": args,
+		"kwargs": kwargs,
+		"future": future,
+		"attempts": 0
+	}
+
+	count(f"calls_{method}")
+	dispatch_queue.put((priority, next(sequence), item))
+
+	return future
+
+def call(team_id, method, function, *args, priority=PRIORITY_BACKGROUND, **kwargs):
+	"""Calls a Slack Web API method through the dispatcher and waits for its response.
+	Only for calls whose response is needed, see submit.
+	Args:
+	    team_id: The team the call is made for, each team has its own buckets.
+	    method: The WebClient method name, e.g. views_publish. Picks the rate limit.
+	    function: What to call, e.g. client.views_publish or say.
+	    priority: PRIORITY_ANSWER, PRIORITY_INTERACTIVE or PRIORITY_BACKGROUND."""
+	return enqueue(team_id, method, function, args, kwargs, priority).result()
+
+def submit(team_id, method, function, *args, priority=PRIORITY_BACKGROUND, **kwargs):
+	"""Queues a Slack Web API call through the dispatcher without waiting for it, so the calling thread is free while
+	the call waits for a token. Failures are logged. Returns a Future of the response.
+	Args:
+	    See call."""
+	future = enqueue(team_id, method, function, args, kwargs, priority)
+	future.add_done_callback(lambda x: log_failure(team_id, method, x))
+
+	return future
+
+def log_failure(team_id, method, future):
+	if future.exception() is not None:
+		logger.error(f"{method} failed for {team_id}: {future.exception()}")
+
+def delay(priority, item, seconds):
+	with delayed_condition:
+		heapq.heappush(delayed_calls, (time.monotonic() + seconds, next(sequence), (priority, item)))
+		delayed_condition.notify()
+
+def run_scheduler():
+	while True:
+		with delayed_condition:
+			while not delayed_calls or delayed_calls[0][0] > time.monotonic():
+				delayed_condition.wait(None if not delayed_calls else delayed_calls[0][0] - time.monotonic())
+
+			ready_at, order, (priority, item) = heapq.heappop(delayed_calls)
+
+		dispatch_queue.put((priority, order, item))
+
+def run_worker():
+	while True:
+		priority, order, item = dispatch_queue.get()
+
+		bucket = get_bucket(item["team_id"], item["method"])
+		wait = bucket.reserve()
+
+		# Don't hold a worker while the bucket refills, other teams and methods can go ahead.
+		if wait > 0:
+			count(f"delayed_{item['method']}")
+			delay(priority, item, wait)
+			continue
+
+		try:
+			response = item["function"](*item["args"], **item["kwargs"])
+		except SlackApiError as e:
+			if e.response is not None and e.response.status_code == 429:
+				headers = {k.lower(): v for k, v in (e.response.headers or {}).items()}
+				retry_after = int(headers.get("retry-after", 1))
+				bucket.block(retry_after)
+				count(f"throttled_{item['method']}")
+
+				item["attempts"] += 1
+				if item["attempts"] <= max_retries:
+					logger.warning(f"{item['method']} rate limited for {item['team_id']}, retrying in {retry_after}s.")
+					delay(priority, item, retry_after)
+					continue
+
+			item["future"].set_exception(e)
+			continue
+		except Exception as e:
+			item["future"].set_exception(e)
+			continue
+
+		item["future"].set_result(response)
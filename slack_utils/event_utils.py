@@ -0,0 +1,116 @@
+# De-duplication stores for Slack event ids, so retried events are only handled once.
+import time
+import logging
+import datetime
+import threading
+
+import sqlalchemy
+from sqlalchemy.exc import IntegrityError
+
+from expiringdict import ExpiringDict
+
+class MemoryEventStore:
+	"""Remembers event ids in this process only. Suits a single worker."""
+
+	def __init__(self, max_len=10000, max_age_seconds=120):
+		self.events = ExpiringDict(max_len=max_len, max_age_seconds=max_age_seconds)
+		self.lock = threading.Lock()
+
+	def add_if_absent(self, event_id):
+		"""Records an event id, returns False if it was already recorded."""
+		with self.lock:
+			if event_id in self.events:
+				return False
+
+			self.events[event_id] = True
+
+			return True
+
+class SQLAlchemyEventStore:
+	"""Remembers event ids in a database table shared by every worker.
+	The primary key makes recording an event an atomic insert-if-absent; expired rows are deleted in batches."""
+
+	default_table_name = "slack_events"
+
+	def __init__(
+		self,
+		engine,
+		expiration_seconds=120,
+		table_name=default_table_name,
+		cleanup_interval_seconds=60,
+		cleanup_batch_size=1000,
+		logger=logging.getLogger(__name__),
+	):
+		self.engine = engine
+		self.expiration_seconds = expiration_seconds
+		self.cleanup_interval_seconds = cleanup_interval_seconds
+		self.cleanup_batch_size = cleanup_batch_size
+		self.logger = logger
+
+		self.metadata = sqlalchemy.MetaData()
+		self.table = sqlalchemy.Table(
+			table_name,
+			self.metadata,
+			sqlalchemy.Column("event_id", sqlalchemy.String(64), primary_key=True),
+			sqlalchemy.Column("received_at", sqlalchemy.DateTime, nullable=False, index=True),
+		)
+
+		self.table_created = False
+		self.last_cleanup = time.monotonic()
+		self.lock = threading.Lock()
+
+	def create_table(self):
+		if self.table_created:
+			return
+
+		with self.lock:
+			if not self.table_created:
+				self.metadata.create_all(self.engine)
+				self.table_created = True
+
+	def add_if_absent(self, event_id):
+		"""Records an event id, returns False if any worker already recorded it."""
+		self.create_table()
+
+		try:
+			with self.engine.begin() as connection:
+				connection.execute(self.table.insert().values(event_id=event_id, received_at=datetime.datetime.utcnow()))
+		except IntegrityError:
+			return False
+
+		self.cleanup_if_due()
+
+		return True
+
+	def cleanup_if_due(self):
+		if time.monotonic() - self.last_cleanup < self.cleanup_interval_seconds:
+			return
+
+		# Only one thread per process cleans up, others carry on.
+		if not self.lock.acquire(blocking=False):
+			return
+
+		try:
+			self.last_cleanup = time.monotonic()
+			self.cleanup()
+		except Exception as e:
+			self.logger.warning(f"Failed to clean up expired events: {e}")
+		finally:
+			self.lock.release()
+
+	def cleanup(self):
+		"""Deletes expired event ids, a batch at a time so no single statement holds locks for long."""
+		cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.expiration_seconds)
+
+		while True:
+			expired = sqlalchemy.select(self.table.c.event_id).where(self.table.c.received_at < cutoff).limit(self.cleanup_batch_size)
+
+			# Ids are selected first and deleted by value, MySQL doesn't allow LIMIT in an IN subquery.
+			with self.engine.begin() as connection:
+				event_ids = [x[0] for x in connection.execute(expired)]
+
+				if event_ids:
+					connection.execute(self.table.delete().where(self.table.c.event_id.in_(event_ids)))
+
+			if len(event_ids) < self.cleanup_batch_size:
+				break
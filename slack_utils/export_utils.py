@@ -0,0 +1,76 @@
+# Signed, time-limited links to a workspace's entries as CSV, and parsing of the CSV imported with /import-entries.
+import io
+import os
+import csv
+import hmac
+import time
+import hashlib
+import urllib.parse
+
+# An empty EXPORT_SECRET (as in .env.example) falls back to the client secret too.
+export_secret = os.environ.get("EXPORT_SECRET") or os.environ.get("SLACK_CLIENT_SECRET") or ""
+export_link_ttl = int(os.environ.get("EXPORT_LINK_TTL_SECONDS", 900))
+
+csv_header = ["question", "answer", "type"]
+
+def get_signature(team_id, expires):
+	return hmac.new(export_secret.encode(), f"{team_id}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+def get_export_url(base_url, team_id):
+	"""Gets a link to download a team's entries that stops working after EXPORT_LINK_TTL_SECONDS.
+	Args:
+	    base_url: The app's public url, e.g. https://example.com/.
+	    team_id: The team whose entries to export."""
+	expires = int(time.time()) + export_link_ttl
+	query = urllib.parse.urlencode({"team": team_id, "expires": expires, "signature": get_signature(team_id, expires)})
+
+	return f"{base_url.rstrip('/')}/export?{query}"
+
+def verify_export(team_id, expires, signature):
+	"""Checks an export link was made by get_export_url and hasn't expired."""
+	if not export_secret or not team_id or not expires or not signature or not expires.isdigit():
+		return False
+
+	if int(expires) < time.time():
+		return False
+
+	return hmac.compare_digest(get_signature(team_id, int(expires)), signature)
+
+def iter_csv(entries):
+	"""Yields a CSV of entries a line at a time.
+	Args:
+	    entries: Iterable of DocumentEntry records, files are skipped."""
+	line = io.StringIO()
+	writer = csv.writer(line)
+
+	writer.writerow(csv_header)
+
+	for entry in entries:
+		if entry.document_type == "file":
+			continue
+
+		writer.writerow([entry.question, entry.answer, entry.document_type])
+
+		yield line.getvalue()
+
+		line.seek(0)
+		line.truncate()
+
+	yield line.getvalue()
+
+def parse_csv(raw_content):
+	"""Gets the (question, answer) rows of an imported CSV, with or without a header row.
+	Args:
+	    raw_content: Raw bytes of the CSV."""
+	rows = []
+
+	for row in csv.reader(io.StringIO(raw_content.decode("utf-8-sig", errors="replace"))):
+		if len(row) < 2 or not row[0].strip() or not row[1].strip():
+			continue
+
+		if [x.strip().lower() for x in row[:2]] == csv_header[:2]:
+			continue
+
+		rows.append((row[0].strip(), row[1].strip()))
+
+	return rows
@@ -0,0 +1,96 @@
+# In-memory cache in front of the installation store, so authorizing an event rarely needs a database query.
+import os
+import threading
+import collections
+
+from cachetools import TTLCache
+from slack_sdk.oauth.installation_store import InstallationStore
+
+class CachedInstallationStore(InstallationStore):
+	"""Wraps an InstallationStore with a TTL'd LRU cache of the bots and installations found per team.
+	Saving or deleting a team's records drops everything cached for the team. Records that weren't found aren't cached,
+	so a team that just installed through another worker is found straight away.
+	Invalidation is per process: after an uninstall or reinstall handled by another worker, this one keeps serving the
+	old token until its entry expires, so keep the TTL short (INSTALLATION_CACHE_TTL_SECONDS, 60 by default)."""
+
+	def __init__(self, installation_store, cache_size=None, ttl_seconds=None):
+		if cache_size is None:
+			cache_size = int(os.environ.get("INSTALLATION_CACHE_SIZE", 10000))
+
+		if ttl_seconds is None:
+			ttl_seconds = int(os.environ.get("INSTALLATION_CACHE_TTL_SECONDS", 60))
+
+		self.installation_store = installation_store
+		self.bots = TTLCache(maxsize=cache_size, ttl=ttl_seconds)
+		self.installations = TTLCache(maxsize=cache_size, ttl=ttl_seconds)
+		self.metrics = collections.Counter()
+		self.lock = threading.Lock()
+
+	def __getattr__(self, name):
+		# Everything else, e.g. metadata and engine, comes from the wrapped store.
+		return getattr(self.installation_store, name)
+
+	@property
+	def logger(self):
+		return self.installation_store.logger
+
+	def get_metrics(self):
+		with self.lock:
+			return dict(self.metrics)
+
+	def invalidate(self, enterprise_id, team_id):
+		"""Drops every cached bot and installation of a team."""
+		with self.lock:
+			for cache in (self.bots, self.installations):
+				for key in [x for x in cache if x[0] == enterprise_id and x[1] == team_id]:
+					cache.pop(key, None)
+
+	def find_cached(self, cache, name, key, find):
+		with self.lock:
+			record = cache.get(key)
+
+			if record is not None:
+				self.metrics[f"{name}_hit"] += 1
+				return record
+
+			self.metrics[f"{name}_miss"] += 1
+
+		record = find()
+
+		if record is not None:
+			with self.lock:
+				cache[key] = record
+
+		return record
+
+	def save(self, installation):
+		self.installation_store.save(installation)
+		self.invalidate(installation.enterprise_id, installation.team_id)
+
+	def find_bot(self, *, enterprise_id, team_id, is_enterprise_install=False):
+		return self.find_cached(
+			self.bots,
+			"bot",
+			(enterprise_id, team_id, is_enterprise_install),
+			lambda: self.installation_store.find_bot(enterprise_id=enterprise_id, team_id=team_id, is_enterprise_install=is_enterprise_install)
+		)
+
+	def find_installation(self, *, enterprise_id, team_id, user_id=None, is_enterprise_install=False):
+		return self.find_cached(
+			self.installations,
+			"installation",
+			(enterprise_id, team_id, user_id, is_enterprise_install),
+			lambda: self.installation_store.find_installation(enterprise_id=enterprise_id, team_id=team_id, user_id=user_id, is_enterprise_install=is_enterprise_install)
+		)
+
+	def delete_bot(self, *, enterprise_id, team_id):
+		self.installation_store.delete_bot(enterprise_id=enterprise_id, team_id=team_id)
+		self.invalidate(enterprise_id, team_id)
+
+	def delete_installation(self, *, enterprise_id, team_id, user_id=None):
+		self.installation_store.delete_installation(enterprise_id=enterprise_id, team_id=team_id, user_id=user_id)
+		self.invalidate(enterprise_id, team_id)
+
+	def delete_all(self, *, enterprise_id, team_id):
+		self.installation_store.delete_all(enterprise_id=enterprise_id, team_id=team_id)
+		self.invalidate(enterprise_id, team_id)
@@ -0,0 +1,119 @@
+# Cheap classification of incoming message events, using only the event payload.
+# Most channel chatter is dropped here, before any Slack or Dialogflow call is made.
+import os
+import re
+import threading
+import collections
+
+from cachetools import LRUCache
+
+from slack_utils import app_constants, dispatch_utils
+
+# Messages dropped by each rule and accepted by each kind.
+message_filter_counters = collections.Counter()
+message_filter_lock = threading.Lock()
+
+# Subtypes that are still ordinary user messages, e.g. a thread reply also sent to the channel or a question posted
+# with an attachment.
+allowed_subtypes = {"thread_broadcast", "file_share"}
+
+# (channel id, ts) -> text of messages seen in events, so answers can find their question without conversations.history.
+message_text_cache = LRUCache(maxsize=int(os.environ.get("MESSAGE_CACHE_SIZE", 10000)))
+message_text_lock = threading.Lock()
+
+def count(name):
+	with message_filter_lock:
+		message_filter_counters[name] += 1
+
+def get_counters():
+	with message_filter_lock:
+		return dict(message_filter_counters)
+
+def classify_message(message):
+	"""Classifies a message event by what the app should do with it.
+	Args:
+	    message: The message event payload.
+	Returns one of question (a direct message to answer), linked_reply, thread_reply or shared_reply
+	(possible instructor answers to learn), or None if the message should be dropped."""
+	if message.get("subtype") is not None and message["subtype"] not in allowed_subtypes:
+		# Edits, deletions, joins, bot messages, etc.
+		rule = "subtype"
+	elif message.get("bot_id") is not None or message.get("bot_profile") is not None:
+		rule = "bot"
+	elif not message.get("text") or not message.get("user"):
+		rule = "no_text"
+	elif message.get("channel_type") == "im":
+		return accept("question")
+	elif app_constants.message_link_pattern.search(re.sub(app_constants.mention_pattern, '', message["text"])):
+		return accept("linked_reply")
+	elif "thread_ts" in message and message["ts"] != message["thread_ts"]:
+		return accept("thread_reply")
+	elif message.get("attachments") and "text" in message["attachments"][0]:
+		return accept("shared_reply")
+	else:
+		rule = "chatter"
+
+	count(f"dropped_{rule}")
+
+	return None
+
+def accept(kind):
+	count(f"accepted_{kind}")
+
+	return kind
+
+def remember_message(message):
+	"""Keeps the text of a message event, following edits and deletions.
+	Args:
+	    message: The message event payload."""
+	subtype = message.get("subtype")
+	channel_id = message.get("channel")
+
+	with message_text_lock:
+		if subtype == "message_changed":
+			edited = message.get("message", {})
+
+			if edited.get("text") and edited.get("ts"):
+				message_text_cache[(channel_id, edited["ts"])] = edited["text"]
+		elif subtype == "message_deleted":
+			message_text_cache.pop((channel_id, message.get("deleted_ts")), None)
+		elif message.get("text") and message.get("ts") and message.get("user"):
+			message_text_cache[(channel_id, message["ts"])] = message["text"]
+
+def get_message_text(client, team_id, channel_id, ts):
+	"""Gets the text of a message, only calling conversations.history if it wasn't seen in an event.
+	Args:
+	    client: The WebClient of the team.
+	    team_id: The team of the channel.
+	    channel_id: The channel of the message.
+	    ts: The ts of the message."""
+	with message_text_lock:
+		text = message_text_cache.get((channel_id, ts))
+
+	if text is not None:
+		count("message_cache_hit")
+		return text
+
+	count("message_cache_miss")
+
+	response = dispatch_utils.call(
+		team_id,
+		"conversations_history",
+		client.conversations_history,
+		channel=channel_id,
+		latest=ts,
+		inclusive=True,
+		limit=1,
+		priority=dispatch_utils.PRIORITY_INTERACTIVE
+	)
+
+	if not response["ok"] or not response["messages"]:
+		return None
+
+	text = response["messages"][0].get("text")
+
+	if text:
+		with message_text_lock:
+			message_text_cache[(channel_id, ts)] = text
+
+	return text
@@ -0,0 +1,109 @@
+# Per-team cache of user roles so permission checks don't call users.info for every message.
+import os
+import threading
+
+from concurrent.futures import Future
+
+from cachetools import TTLCache
+
+from slack_utils import dispatch_utils
+
+# (team id, user id) -> user roles
+user_role_cache = TTLCache(
+	maxsize=int(os.environ.get("USER_ROLE_CACHE_SIZE", 16384)),
+	ttl=int(os.environ.get("USER_ROLE_CACHE_TTL_SECONDS", 600))
+)
+
+# (team id, user id) -> Future of a users.info lookup that is in progress.
+# Invalidating a user drops their lookup from here, so a lookup racing an invalidation isn't cached.
+user_role_lookups = {}
+
+user_role_lock = threading.Lock()
+
+def get_user_roles(user):
+	"""Keeps only the role flags of a Slack user object."""
+	return {
+		"is_admin": user.get("is_admin", False),
+		"is_owner": user.get("is_owner", False),
+		"is_primary_owner": user.get("is_primary_owner", False)
+	}
+
+def get_user(client, team_id, user_id, priority=dispatch_utils.PRIORITY_INTERACTIVE):
+	"""Gets a user's roles, concurrent lookups of the same user share one users.info call.
+	Args:
+	    client: The WebClient of the team.
+	    team_id: The team the user belongs to.
+	    user_id: The user.
+	    priority: The dispatch priority of the users.info call, if one is needed."""
+	key = (team_id, user_id)
+
+	with user_role_lock:
+		roles = user_role_cache.get(key)
+
+		if roles is not None:
+			return roles
+
+		lookup = user_role_lookups.get(key)
+
+		if lookup is not None:
+			owner = False
+		else:
+			owner = True
+			lookup = Future()
+			user_role_lookups[key] = lookup
+
+	if not owner:
+		return lookup.result()
+
+	try:
+		response = dispatch_utils.call(team_id, "users_info", client.users_info, user=user_id, priority=priority)
+		roles = get_user_roles(response["user"])
+	except Exception as e:
+		with user_role_lock:
+			if user_role_lookups.get(key) is lookup:
+				user_role_lookups.pop(key)
+
+		lookup.set_exception(e)
+		raise
+
+	with user_role_lock:
+		if user_role_lookups.get(key) is lookup:
+			user_role_cache[key] = roles
+			user_role_lookups.pop(key)
+
+	lookup.set_result(roles)
+
+	return roles
+
+def update_user(team_id, user):
+	"""Replaces a user's cached roles with the user object from a user_change or team_join event.
+	Args:
+	    team_id: The team the user belongs to.
+	    user: The Slack user object."""
+	key = (team_id, user["id"])
+
+	with user_role_lock:
+		user_role_lookups.pop(key, None)
+		user_role_cache[key] = get_user_roles(user)
+
+def invalidate_user(team_id, user_id):
+	"""Forgets a user's cached roles.
+	Args:
+	    team_id: The team the user belongs to.
+	    user_id: The user."""
+	key = (team_id, user_id)
+
+	with user_role_lock:
+		user_role_lookups.pop(key, None)
+		user_role_cache.pop(key, None)
+
+def invalidate_team(team_id):
+	"""Forgets the cached roles of every user in a team.
+	Args:
+	    team_id: The team."""
+	with user_role_lock:
+		for key in [x for x in user_role_lookups if x[0] == team_id]:
+			user_role_lookups.pop(key)
+
+		for key in [x for x in user_role_cache if x[0] == team_id]:
+			user_role_cache.pop(key, None)
@@ -0,0 +1,154 @@
+# Debounced App Home rendering.
+# Refreshes requested for the same (team, user) within a short window are coalesced into one render, at most one
+# render runs per user at a time, and the render that runs always uses the latest request.
+# Also keeps the page and search query each user is looking at, so only the visible page is built.
+# A render whose view hashes the same as the one last published to the user skips views.publish.
+import os
+import json
+import hashlib
+import logging
+import threading
+import collections
+
+from cachetools import LRUCache, TTLCache
+
+logger = logging.getLogger(__name__)
+
+render_delay = float(os.environ.get("APP_HOME_RENDER_DELAY_SECONDS", 0.5))
+
+# (team id, user id) -> {"render": latest render function, "scheduled": bool, "running": bool}
+render_states = {}
+render_lock = threading.Lock()
+
+metrics = collections.Counter()
+
+# (team id, user id) -> hash of the last view published, expiring so App Home is eventually republished regardless.
+published_hashes = TTLCache(
+	maxsize=int(os.environ.get("APP_HOME_STATE_CACHE_SIZE", 10000)),
+	ttl=int(os.environ.get("APP_HOME_PUBLISH_TTL_SECONDS", 3600))
+)
+
+# Entries or files shown per App Home section.
+page_size = int(os.environ.get("APP_HOME_PAGE_SIZE", 10))
+
+# (team id, user id) -> {"query": search query, "pages": {section: page}}
+view_states = LRUCache(maxsize=int(os.environ.get("APP_HOME_STATE_CACHE_SIZE", 10000)))
+
+def get_metrics():
+	with render_lock:
+		return dict(metrics)
+
+def request_render(team_id, user_id, render):
+	"""Schedules a render of a user's App Home, coalescing it with any render already scheduled.
+	Args:
+	    team_id: The team of the user.
+	    user_id: The user whose App Home to render.
+	    render: Function that renders and publishes the App Home, the latest one requested is run."""
+	key = (team_id, user_id)
+
+	with render_lock:
+		metrics["requested"] += 1
+
+		state = render_states.get(key)
+
+		if state is None:
+			state = {"render": None, "scheduled": False, "running": False}
+			render_states[key] = state
+
+		state["render"] = render
+
+		if state["scheduled"]:
+			metrics["coalesced"] += 1
+			return
+
+		state["scheduled"] = True
+
+		# A running render schedules the next one itself when it finishes.
+		if not state["running"]:
+			start_timer(key)
+
+def start_timer(key):
+	timer = threading.Timer(render_delay, run_render, args=(key,))
+	timer.daemon = True
+	timer.start()
+
+def run_render(key):
+	with render_lock:
+		state = render_states[key]
+		state["scheduled"] = False
+		state["running"] = True
+		render = state["render"]
+		metrics["rendered"] += 1
+
+	try:
+		render()
+	except Exception as e:
+		logger.warning(f"Failed to render App Home for {key[1]} in {key[0]}: {e}")
+	finally:
+		with render_lock:
+			state["running"] = False
+
+			if state["scheduled"]:
+				start_timer(key)
+			else:
+				render_states.pop(key, None)
+
+def get_view_hash(view):
+	"""Gets a stable hash of a view, equal views hash the same regardless of key order."""
+	return hashlib.sha256(json.dumps(view, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def publish_if_changed(team_id, user_id, view, publish):
+	"""Publishes a view unless it is the same as the last one published to the user.
+	Args:
+	    team_id: The team of the user.
+	    user_id: The user whose App Home is published.
+	    view: The App Home view.
+	    publish: Function that publishes the view.
+	Returns the response of publish, or None if the publish was skipped."""
+	key = (team_id, user_id)
+	view_hash = get_view_hash(view)
+
+	with render_lock:
+		if published_hashes.get(key) == view_hash:
+			metrics["unchanged"] += 1
+			return None
+
+	response = publish(view)
+
+	with render_lock:
+		published_hashes[key] = view_hash
+		metrics["published"] += 1
+
+	return response
+
+def forget_published(team_id, user_id):
+	"""Makes the next render publish even if the view didn't change."""
+	with render_lock:
+		published_hashes.pop((team_id, user_id), None)
+
+def get_view_state(team_id, user_id):
+	"""Gets the search query and section pages a user is looking at in App Home."""
+	with render_lock:
+		state = view_states.get((team_id, user_id))
+
+		if state is None:
+			return {"query": "", "pages": {}}
+
+		return {"query": state["query"], "pages": dict(state["pages"])}
+
+def set_page(team_id, user_id, section, page):
+	with render_lock:
+		state = view_states.setdefault((team_id, user_id), {"query": "", "pages": {}})
+		state["pages"][section] = max(0, page)
+
+def set_query(team_id, user_id, query):
+	"""Searches App Home, every section goes back to its first page."""
+	with render_lock:
+		view_states[(team_id, user_id)] = {"query": (query or "").strip(), "pages": {}}
+
+def get_page(items, page):
+	"""Returns (items on the page, page, number of pages), clamping the page to the ones that exist."""
+	pages = max(1, -(-len(items) // page_size))
+	page = min(max(page, 0), pages - 1)
+
+	return items[page * page_size:(page + 1) * page_size], page, pages
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("google.cloud.dialogflow_v2beta1")
+
+from dialogflow_utils import document_utils, retrieval_utils
+
+def get_shard_entries(document_id, shard_name, rows):
+	return [
+		document_utils.DocumentEntry(document_id, document_utils.get_entry_name("manual", question, answer), "manual", question, answer, shard_name)
+		for question, answer in rows
+	]
+
+@pytest.fixture
+def knowledge_base_id():
+	knowledge_base_id = "test-documents"
+
+	yield knowledge_base_id
+
+	document_utils.drop_document_index(knowledge_base_id)
+
+def test_unindexing_replaced_shard_keeps_rewritten_entries(knowledge_base_id):
+	old = get_shard_entries("old", "Manual_Entry|shard-old.csv", [("When is the midterm exam?", "October 12th"), ("Is attendance mandatory?", "Yes")])
+	new = get_shard_entries("new", "Manual_Entry|shard-new.csv", [("When is the midterm exam?", "October 12th")])
+
+	# The replaced shard is listed last, so its copy of the entry is the one in use until it is deleted.
+	document_utils.rebuild_document_index(knowledge_base_id, new + old, document_utils.get_document_generation(knowledge_base_id))
+	document_utils.complete_delete_document(knowledge_base_id, "old")
+
+	index = document_utils.document_index[knowledge_base_id]
+	name = new[0].display_name
+
+	assert index["documents"][name].document_id == "new"
+	assert index["uids"][document_utils.get_document_uid(name)] == name
+	assert index["types"]["manual"] == {name}
+	assert index["copies"] == {}
+	assert retrieval_utils.find_answer(knowledge_base_id, "When is the midterm exam?") == ("October 12th", "manual")
+	assert retrieval_utils.find_answer(knowledge_base_id, "Is attendance mandatory?") is None
+
+def test_unindexing_rewritten_shard_keeps_entries_of_replaced_shard(knowledge_base_id):
+	old = get_shard_entries("old", "Manual_Entry|shard-old.csv", [("When is the midterm exam?", "October 12th")])
+	new = get_shard_entries("new", "Manual_Entry|shard-new.csv", [("When is the midterm exam?", "October 12th")])
+
+	for entry in old + new:
+		document_utils.index_document(knowledge_base_id, entry)
+
+	document_utils.complete_delete_document(knowledge_base_id, "new")
+
+	assert document_utils.document_index[knowledge_base_id]["documents"][old[0].display_name].document_id == "old"
+
+def test_get_all_documents_reads_the_loaded_index(knowledge_base_id, monkeypatch):
+	entries = get_shard_entries("shard", "Manual_Entry|shard-a.csv", [("When is the midterm exam?", "October 12th")])
+	document_utils.rebuild_document_index(knowledge_base_id, entries, document_utils.get_document_generation(knowledge_base_id))
+
+	refreshed = []
+
+	def list_documents(project_id, knowledge_base_id):
+		raise AssertionError("The index shouldn't be listed again.")
+
+	monkeypatch.setattr(document_utils, "list_documents", list_documents)
+	monkeypatch.setattr(document_utils, "refresh_document_index", lambda project_id, knowledge_base_id: refreshed.append(knowledge_base_id))
+
+	assert document_utils.get_all_documents("project", knowledge_base_id) == entries
+	assert refreshed == [knowledge_base_id]
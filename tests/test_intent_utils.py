@@ -0,0 +1,43 @@
+import time
+import types
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.cloud.dialogflow_v2beta1")
+
+from dialogflow_utils import async_utils, intent_utils
+
+texts = ["When is the midterm exam?", "Where are office hours held?", "How late can homework be submitted?", "Is attendance mandatory?"]
+
+def test_batch_answers_come_back_in_order(monkeypatch):
+	def detect_intent_knowledge_text(session_path, language_code, knowledge_base_path, text):
+		# Later texts finish first, so the results only line up if they're put back in order.
+		time.sleep(0.05 * (len(texts) - texts.index(text)))
+		return (session_path, text)
+
+	monkeypatch.setattr(intent_utils, "detect_intent_knowledge_text", detect_intent_knowledge_text)
+
+	results = intent_utils.detect_intent_knowledge("project", "team_user", "en", "knowledge-base", texts)
+
+	assert [x[1] for x in results] == texts
+	assert len({x[0] for x in results}) == len(texts)
+
+def test_single_text_keeps_session(monkeypatch):
+	monkeypatch.setattr(intent_utils, "detect_intent_knowledge_text", lambda session_path, *args: session_path)
+
+	assert intent_utils.detect_intent_knowledge("project", "team_user", "en", "knowledge-base", texts[:1]) == ["projects/project/agent/sessions/team_user"]
+
+def test_async_batch_answers_come_back_in_order(monkeypatch):
+	class SessionsClient:
+		async def detect_intent(self, request):
+			text = request.query_input.text.text
+			await asyncio.sleep(0.05 * (len(texts) - texts.index(text)))
+			return types.SimpleNamespace(query_result=types.SimpleNamespace(knowledge_answers=(request.session, text)))
+
+	monkeypatch.setattr(async_utils, "get_async_client", lambda client_class: SessionsClient())
+
+	results = asyncio.run(async_utils.detect_intent_knowledge("project", "team_user", "en", "knowledge-base", texts))
+
+	assert [x[1] for x in results] == texts
+	assert len({x[0] for x in results}) == len(texts)
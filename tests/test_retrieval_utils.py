@@ -0,0 +1,80 @@
+import pytest
+
+from dialogflow_utils import retrieval_utils
+
+@pytest.fixture
+def knowledge_base_id():
+	knowledge_base_id = "test-retrieval"
+
+	retrieval_utils.add_entry(knowledge_base_id, "Manual_Entry|a.csv", "When is the midterm exam?", "October 12th", "manual")
+	retrieval_utils.add_entry(knowledge_base_id, "Learned_Entry|b.csv", "Where are office hours held?", "Room 101", "learned")
+	retrieval_utils.add_entry(knowledge_base_id, "Manual_Entry|c.csv", "How late can homework be submitted?", "Two days", "manual")
+
+	yield knowledge_base_id
+
+	retrieval_utils.drop_index(knowledge_base_id)
+
+def test_tokenize_drops_stop_words_and_punctuation():
+	assert retrieval_utils.tokenize("When is the Midterm exam?") == ["when", "midterm", "exam"]
+
+def test_find_answer_matches_rephrased_question(knowledge_base_id):
+	assert retrieval_utils.find_answer(knowledge_base_id, "when is the midterm exam") == ("October 12th", "manual")
+	assert retrieval_utils.find_answer(knowledge_base_id, "Where are the office hours held?") == ("Room 101", "learned")
+
+def test_find_answer_rejects_weak_matches(knowledge_base_id):
+	assert retrieval_utils.find_answer(knowledge_base_id, "Is the final exam open book?") is None
+	assert retrieval_utils.find_answer(knowledge_base_id, "What is the syllabus?") is None
+
+def test_find_answer_tells_question_words_apart():
+	knowledge_base_id = "test-question-words"
+
+	retrieval_utils.add_entry(knowledge_base_id, "Manual_Entry|a.csv", "When is the midterm exam?", "October 12th", "manual")
+	retrieval_utils.add_entry(knowledge_base_id, "Manual_Entry|b.csv", "Where is the final exam?", "Hall B", "manual")
+
+	try:
+		assert retrieval_utils.find_answer(knowledge_base_id, "Where is the midterm exam?") is None
+		assert retrieval_utils.find_answer(knowledge_base_id, "When is the final exam?") is None
+		assert retrieval_utils.find_answer(knowledge_base_id, "when is the midterm exam") == ("October 12th", "manual")
+		assert retrieval_utils.find_answer(knowledge_base_id, "where is the final exam") == ("Hall B", "manual")
+	finally:
+		retrieval_utils.drop_index(knowledge_base_id)
+
+def test_find_answer_without_index():
+	assert retrieval_utils.find_answer("test-missing", "When is the midterm exam?") is None
+
+def test_removed_entry_is_not_matched(knowledge_base_id):
+	retrieval_utils.remove_entry(knowledge_base_id, "Manual_Entry|a.csv")
+
+	assert retrieval_utils.find_answer(knowledge_base_id, "When is the midterm exam?") is None
+
+def test_vocabulary_drops_terms_of_removed_entries():
+	index = retrieval_utils.RetrievalIndex()
+	index.add("a", "midterm exam date", "October 12th", "manual")
+	index.add("b", "office hours room", "Room 101", "manual")
+	index.query("midterm")
+
+	index.remove("a")
+	index.query("office")
+
+	assert set(index.vocabulary) == {"office", "hours", "room"}
+	assert index.matrix.shape == (1, 3)
+
+def test_query_scores_exact_question_highest():
+	index = retrieval_utils.RetrievalIndex()
+	index.add("a", "midterm exam date", "October 12th", "manual")
+	index.add("b", "final exam date", "December 5th", "manual")
+
+	entry_name, score, answer, document_type = index.query("final exam date")
+
+	assert entry_name == "b"
+	assert score == pytest.approx(1.0)
+	assert answer == "December 5th"
+
+def test_set_index_replaces_entries(knowledge_base_id):
+	index = retrieval_utils.RetrievalIndex()
+	index.add("Manual_Entry|d.csv", "Is attendance mandatory?", "Yes", "manual")
+
+	retrieval_utils.set_index(knowledge_base_id, index)
+
+	assert retrieval_utils.find_answer(knowledge_base_id, "When is the midterm exam?") is None
+	assert retrieval_utils.find_answer(knowledge_base_id, "Is attendance mandatory?") == ("Yes", "manual")
@@ -0,0 +1,75 @@
+import numpy
+import pytest
+
+from dialogflow_utils import similarity_utils
+
+@pytest.fixture
+def knowledge_base_id():
+	knowledge_base_id = "test-similarity"
+
+	similarity_utils.add_entry(knowledge_base_id, "Learned_Entry|a.csv", "When is the midterm exam this semester?", "October 12th")
+	similarity_utils.add_entry(knowledge_base_id, "Learned_Entry|b.csv", "Where are office hours held?", "Room 101")
+	similarity_utils.add_entry(knowledge_base_id, "Learned_Entry|c.csv", "When is homework 3 due?", "Friday at noon")
+
+	yield knowledge_base_id
+
+	similarity_utils.drop_index(knowledge_base_id)
+
+def test_signature_is_deterministic():
+	signature = similarity_utils.get_signature("When is the midterm exam?")
+
+	assert len(signature) == similarity_utils.permutations
+	assert numpy.array_equal(signature, similarity_utils.get_signature("when is the MIDTERM exam"))
+
+def test_finds_near_duplicate(knowledge_base_id):
+	matches = similarity_utils.find_similar_entries(knowledge_base_id, "When is the midterm exam this semester??", "October 12th.")
+
+	assert [x[0] for x in matches] == ["Learned_Entry|a.csv"]
+	assert matches[0][1] == pytest.approx(1.0)
+
+def test_ignores_different_question(knowledge_base_id):
+	assert similarity_utils.find_similar_entries(knowledge_base_id, "Can I bring a calculator to the final?", "Yes") == []
+
+@pytest.mark.parametrize("question, answer", [
+	("When is homework 4 due?", "Friday at noon"),
+	("When is homework 4 due?", "Monday at noon"),
+	("Where is the midterm exam this semester?", "October 12th"),
+	("Where is the midterm exam this semester?", "Hall B"),
+	("When is the midterm exam this semester?", "Hall B")
+])
+def test_ignores_near_misses(knowledge_base_id, question, answer):
+	assert similarity_utils.find_similar_entries(knowledge_base_id, question, answer) == []
+
+def test_near_miss_scores_are_below_default_threshold():
+	pairs = [
+		("When is homework 4 due?", "When is homework 3 due?"),
+		("Where is the midterm exam?", "When is the midterm exam?")
+	]
+
+	for question, other in pairs:
+		score = similarity_utils.get_similarity(similarity_utils.get_signature(question), similarity_utils.get_signature(other))
+
+		assert score < similarity_utils.duplicate_threshold
+
+def test_threshold_is_respected(knowledge_base_id):
+	question = "When is the midterm exam next semester?"
+
+	assert similarity_utils.find_similar_entries(knowledge_base_id, question, "October 12th", threshold=1.0) == []
+	assert [x[0] for x in similarity_utils.find_similar_entries(knowledge_base_id, question, "October 12th", threshold=0.3)] == ["Learned_Entry|a.csv"]
+
+def test_removed_entry_is_not_found(knowledge_base_id):
+	similarity_utils.remove_entry(knowledge_base_id, "Learned_Entry|a.csv")
+
+	assert similarity_utils.find_similar_entries(knowledge_base_id, "When is the midterm exam this semester?", "October 12th") == []
+
+def test_remove_clears_buckets():
+	index = similarity_utils.SimilarityIndex()
+	index.add("a", "Where are office hours held?", "Room 101")
+	index.remove("a")
+
+	assert index.signatures == {}
+	assert index.answer_signatures == {}
+	assert index.buckets == {}
+
+def test_without_index():
+	assert similarity_utils.find_similar_entries("test-missing", "Where are office hours held?", "Room 101") == []